@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_CODE = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+PROJECT_PACKAGES = ("main", "models", "modules")
+
+
+def run_import(module:str, importtime:bool = False) -> subprocess.CompletedProcess:
+    # Every import runs in a new interpreter, so nothing is cached in sys.modules.
+    options = ["-X", "importtime"] if importtime else []
+    return subprocess.run(
+        [sys.executable, *options, "-c", IMPORT_CODE.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+def measure_import_seconds(module:str) -> float:
+    return float(run_import(module).stdout.strip().splitlines()[-1])
+
+
+def parse_importtime(output:str) -> list[dict]:
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return modules
+
+
+def summarize_packages(modules:list[dict]) -> dict[str, int]:
+    packages = {}
+    for module in modules:
+        package = module["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + module["self_us"]
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def run_benchmark(module:str, repeat:int, top:int) -> dict:
+    durations = [measure_import_seconds(module) for _ in range(repeat)]
+    modules = parse_importtime(run_import(module, importtime=True).stderr)
+    packages = summarize_packages(modules)
+    return {
+        "module": module,
+        "repeat": repeat,
+        "import_seconds": {"min": min(durations), "median": statistics.median(durations)},
+        "project_us": sum(packages.get(package, 0) for package in PROJECT_PACKAGES),
+        "packages_us": dict(list(packages.items())[:top]),
+        "modules": sorted(modules, key=lambda module: module["self_us"], reverse=True)[:top],
+    }
+
+
+def main(argv:list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import time benchmark of the service's cold start.")
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--repeat", type=int, default=5, help="imports in new interpreters, the fastest and the median are reported")
+    parser.add_argument("--top", type=int, default=15, help="number of reported packages and modules with the highest import time")
+    parser.add_argument("--budget", type=float, default=None, help="fail if the fastest import takes longer, in seconds")
+    args = parser.parse_args(argv)
+    result = run_benchmark(args.module, args.repeat, args.top)
+    print(json.dumps(result, indent=2))
+    if args.budget is not None and result["import_seconds"]["min"] > args.budget:
+        print(f"Import of {args.module} exceeds the budget of {args.budget}s.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+from modules.storage.storage import DetaStorage
+from tests.stubs.components_service import StubComponentsService
+from tests.stubs.deta_base import FakeDetaBase
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+
+BENCHMARK_USER_ID = "benchmark-user"
+BENCHMARK_WEBHOOK_TOKEN = "benchmark-webhook-token"
+COMPONENT_COUNT = 200
+COMPONENTS_PER_PRODUCT = 10
+BATCH_SIZE = 25
+# Metrics compared against the baseline in compare mode.
+LATENCY_METRICS = ("p50", "p95", "p99")
+THROUGHPUT_METRICS = ("requests_per_second",)
+
+
+def percentile(sorted_values:list[float], percent:float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies:list[float], errors:int, duration:float, conflicts:int = 0) -> dict:
+    sorted_latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "conflicts": conflicts,
+        "requests_per_second": len(latencies) / duration if duration > 0 else 0.0,
+        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50": percentile(sorted_latencies, 50),
+        "p95": percentile(sorted_latencies, 95),
+        "p99": percentile(sorted_latencies, 99),
+    }
+
+
+def compare(results:dict, baseline:dict, threshold:float) -> list[str]:
+    regressions = []
+    for endpoint, baseline_metrics in baseline["endpoints"].items():
+        metrics = results["endpoints"].get(endpoint)
+        if metrics is None:
+            continue
+        for metric in THROUGHPUT_METRICS:
+            if baseline_metrics[metric] > 0 and metrics[metric] < baseline_metrics[metric] * (1 - threshold):
+                regressions.append(f"{endpoint} {metric}: {metrics[metric]:.2f} < baseline {baseline_metrics[metric]:.2f}")
+        for metric in LATENCY_METRICS:
+            if baseline_metrics[metric] > 0 and metrics[metric] > baseline_metrics[metric] * (1 + threshold):
+                regressions.append(f"{endpoint} {metric}: {metrics[metric] * 1000:.2f}ms > baseline {baseline_metrics[metric] * 1000:.2f}ms")
+    return regressions
+
+
+def create_product(component_ids:list[str], key:str = None) -> dict:
+    product = {
+        "ownerId": BENCHMARK_USER_ID,
+        "name": "benchmark product",
+        "description": "product created by the load benchmark",
+        "componentIds": component_ids,
+    }
+    if key is not None:
+        product["productId"] = key
+    return product
+
+
+class BenchmarkState:
+    def __init__(self, main, products:int, seed:int):
+        self.main = main
+        self.random = random.Random(seed)
+        self.component_ids = [f"component-{index}" for index in range(COMPONENT_COUNT)]
+        self.product_keys = [str(uuid.UUID(int=self.random.getrandbits(128))) for _ in range(products)]
+        self.deletable_keys = []
+
+    def random_component_ids(self) -> list[str]:
+        return self.random.sample(self.component_ids, COMPONENTS_PER_PRODUCT)
+
+    def random_product_key(self) -> str:
+        return self.random.choice(self.product_keys)
+
+    def seed_products(self, keys:list[str]):
+        stored_products = []
+        for key in keys:
+            component_ids = self.random_component_ids()
+            stored_products.append({
+                "key": key,
+                "owner_id": BENCHMARK_USER_ID,
+                "name": "benchmark product",
+                "description": "product seeded by the load benchmark",
+                "component_ids": component_ids,
+                "price": float(len(component_ids)),
+            })
+        storage = self.main.productsDB.storage
+        for start in range(0, len(stored_products), BATCH_SIZE):
+            storage.put_many(stored_products[start:start + BATCH_SIZE])
+
+
+def create_scenarios(state:BenchmarkState) -> dict:
+    headers = {"userId": BENCHMARK_USER_ID}
+
+    async def get_products(client, index):
+        return await client.get("/products", headers=headers)
+
+    async def get_products_page(client, index):
+        return await client.get("/products?limit=50", headers=headers)
+
+    async def get_products_stream(client, index):
+        return await client.get("/products?stream=ndjson", headers=headers)
+
+    async def get_product(client, index):
+        return await client.get(f"/products/{state.random_product_key()}", headers=headers)
+
+    async def get_pricing_status(client, index):
+        return await client.get(f"/products/{state.random_product_key()}/pricing-status", headers=headers)
+
+    async def post_product(client, index):
+        return await client.post("/products", json=create_product(state.random_component_ids()), headers=headers)
+
+    async def post_product_async(client, index):
+        return await client.post("/products", json=create_product(state.random_component_ids()), headers={**headers, "Prefer": "respond-async"})
+
+    async def put_product(client, index):
+        product = create_product(state.random_component_ids(), key=state.random_product_key())
+        return await client.put("/products", json=product, headers=headers)
+
+    async def patch_product(client, index):
+        product = create_product(state.random_component_ids())
+        return await client.patch(f"/products/{state.random_product_key()}", json=product, headers=headers)
+
+    async def delete_product(client, index):
+        return await client.delete(f"/products/{state.deletable_keys.pop()}", headers=headers)
+
+    async def post_products_batch(client, index):
+        products = [create_product(state.random_component_ids()) for _ in range(BATCH_SIZE)]
+        return await client.post("/products:batch", json=products, headers=headers)
+
+    async def put_products_batch(client, index):
+        products = [create_product(state.random_component_ids(), key=state.random_product_key()) for _ in range(BATCH_SIZE)]
+        return await client.put("/products:batch", json=products, headers=headers)
+
+    async def put_component_price(client, index):
+        price_change = {"price": float(index % 50 + 1), "previousPrice": float((index - 1) % 50 + 1)}
+        return await client.put(f"/components/{state.random.choice(state.component_ids)}/price", json=price_change, headers={"X-Webhook-Token": BENCHMARK_WEBHOOK_TOKEN})
+
+    async def lookup_products(client, index):
+        product_ids = [state.random_product_key() for _ in range(BATCH_SIZE)]
+        return await client.post("/products:lookup", json={"productIds": product_ids}, headers=headers)
+
+    async def search_products(client, index):
+        component_id = state.random.choice(state.component_ids)
+        return await client.get(f"/products?namePrefix=bench&componentId={component_id}&minPrice=5&sort=-price&limit=20", headers=headers)
+
+    async def get_cache_stats(client, index):
+        return await client.get("/cache/stats")
+
+    async def get_metrics(client, index):
+        return await client.get("/metrics")
+
+    return {
+        "get_products": get_products,
+        "get_products_page": get_products_page,
+        "get_products_stream": get_products_stream,
+        "get_product": get_product,
+        "get_pricing_status": get_pricing_status,
+        "post_product": post_product,
+        "post_product_async": post_product_async,
+        "put_product": put_product,
+        "patch_product": patch_product,
+        "delete_product": delete_product,
+        "post_products_batch": post_products_batch,
+        "put_products_batch": put_products_batch,
+        "put_component_price": put_component_price,
+        "lookup_products": lookup_products,
+        "search_products": search_products,
+        "get_cache_stats": get_cache_stats,
+        "get_metrics": get_metrics,
+    }
+
+
+async def run_scenario(client, scenario, requests:int, concurrency:int) -> dict:
+    latencies = []
+    errors = 0
+    conflicts = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, conflicts, next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, index)
+                # Concurrent writes to the same product are rejected by the conditional writes.
+                conflicted = response.status_code == 412
+                failed = response.status_code >= 400 and not conflicted
+            except Exception:
+                conflicted = False
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+            conflicts += conflicted
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start, conflicts)
+
+
+def load_app(db_latency:float, upstream_latency:float):
+    # The app reads its configuration at import time, so the offline backend is selected first.
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ.setdefault("COMPONENTS_SERVICE_URL", "http://components")
+    # All requests come from one user, whose rate limit would be measured instead of the service.
+    os.environ.setdefault("USER_PRICING_RATE", "0")
+    os.environ.setdefault("PRICE_WEBHOOK_TOKEN", BENCHMARK_WEBHOOK_TOKEN)
+    import main
+
+    components_service = StubComponentsService(
+        {f"component-{index}": float(index % 50 + 1) for index in range(COMPONENT_COUNT)},
+        delay=upstream_latency,
+    )
+    # The Deta backend runs against a fake base, so its reads before conditional writes are measured as well.
+    main.productsDB.storage = DetaStorage(None, "products", base=FakeDetaBase(latency=db_latency))
+    # The client of the service is kept, so its circuit breaker and metrics are part of the measurement.
+    main.price_client._transport = components_service.transport()
+    return main, components_service
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+
+    main, components_service = load_app(args.db_latency, args.upstream_latency)
+    state = BenchmarkState(main, args.products, args.seed)
+    state.seed_products(state.product_keys)
+    scenarios = create_scenarios(state)
+    endpoints = args.endpoints.split(",") if args.endpoints else list(scenarios)
+
+    results = {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "products": args.products,
+            "db_latency": args.db_latency,
+            "upstream_latency": args.upstream_latency,
+            "seed": args.seed,
+        },
+        "endpoints": {},
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for endpoint in endpoints:
+            if endpoint == "delete_product":
+                state.deletable_keys = [str(uuid.UUID(int=state.random.getrandbits(128))) for _ in range(args.requests)]
+                state.seed_products(state.deletable_keys)
+            upstream_calls_before = sum(components_service.calls.values())
+            results["endpoints"][endpoint] = await run_scenario(client, scenarios[endpoint], args.requests, args.concurrency)
+            results["endpoints"][endpoint]["upstream_calls"] = sum(components_service.calls.values()) - upstream_calls_before
+    await main.pricing_queue.stop(drain_timeout=main.PRICING_DRAIN_TIMEOUT)
+    await main.price_client.aclose()
+    return results
+
+
+def parse_args(argv:list[str] = None):
+    parser = argparse.ArgumentParser(description="Load benchmark of the product service against local stand-ins for Deta and the components service.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent requests per endpoint")
+    parser.add_argument("--products", type=int, default=500, help="products seeded for the benchmark user")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="latency of every storage call in seconds")
+    parser.add_argument("--upstream-latency", type=float, default=0.02, help="latency of every components service call in seconds")
+    parser.add_argument("--endpoints", default=None, help="comma separated endpoint scenarios, all if omitted")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the generated products and requests")
+    parser.add_argument("--output", default=None, help="file the JSON results are written to, stdout if omitted")
+    parser.add_argument("--compare", default=None, help="baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression in compare mode")
+    return parser.parse_args(argv)
+
+
+def main(argv:list[str] = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+from models import product_models
+from fastapi.encoders import jsonable_encoder
+import modules.serialization.serialization as serialization
+import argparse
+import json
+import sys
+import time
+import uuid
+
+
+def create_products(count:int) -> list[dict]:
+    return [
+        {
+            "key": str(uuid.UUID(int=index)),
+            "owner_id": "benchmark-user",
+            "name": f"benchmark product {index}",
+            "description": "product serialized by the serialization benchmark",
+            "component_ids": [f"component-{component}" for component in range(index % 10, index % 10 + 10)],
+            "price": index * 1.25,
+        }
+        for index in range(count)
+    ]
+
+
+def serialize_with_response_model(products:list[dict]) -> bytes:
+    # What FastAPI does for a response_model: validate, encode and dump with the standard library.
+    validated = [product_models.ProductResponseModel(**product) for product in products]
+    content = jsonable_encoder(validated, by_alias=True, exclude_unset=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def serialize_validated(products:list[dict]) -> bytes:
+    return serialization.dumps([
+        product_models.ProductResponseModel(**product).dict(by_alias=True, exclude_unset=True) for product in products
+    ])
+
+
+def serialize_trusted(products:list[dict]) -> bytes:
+    aliases = serialization.field_aliases(product_models.ProductResponseModel)
+    return serialization.dumps([serialization.to_aliases(product, aliases) for product in products])
+
+
+SERIALIZERS = {
+    "response_model": serialize_with_response_model,
+    "validated": serialize_validated,
+    "trusted": serialize_trusted,
+}
+
+
+def measure(serializer, products:list[dict], repeat:int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        serializer(products)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def run_benchmark(products:int, repeat:int) -> dict:
+    stored_products = create_products(products)
+    bodies = {name: json.loads(serializer(stored_products)) for name, serializer in SERIALIZERS.items()}
+    if any(body != bodies["response_model"] for body in bodies.values()):
+        raise AssertionError("Serializers produced different responses.")
+
+    durations = {name: measure(serializer, stored_products, repeat) for name, serializer in SERIALIZERS.items()}
+    baseline = durations["response_model"]
+    return {
+        "products": products,
+        "repeat": repeat,
+        "json_library": "orjson" if serialization.orjson is not None else "json",
+        "serializers": {
+            name: {"seconds": duration, "speedup": baseline / duration if duration else 0.0}
+            for name, duration in durations.items()
+        },
+    }
+
+
+def main(argv:list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serialization benchmark of product lists.")
+    parser.add_argument("--products", type=int, default=10000, help="products per serialized list")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per serializer, the fastest one is reported")
+    args = parser.parse_args(argv)
+    print(json.dumps(run_benchmark(args.products, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,210 @@
-from fastapi import FastAPI, status, HTTPException, Header
-from deta import Deta, Base
+from fastapi import FastAPI, status, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from decouple import config
-from models import product_models,error_models
-import requests
+from models import product_models,error_models,cache_models
+from modules.ttl_cache.ttl_cache import TTLCache
+from modules.circuit_breaker.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from modules.component_index.component_index import ComponentIndex
+from modules.product_search.product_search import ProductQuery, ProductSearchIndex
+from modules.admission.admission import AdmissionController, AdmissionRejectedError
+from modules.pricing_queue.pricing_queue import PricingQueue, PricingQueueFullError
+from modules.owner_list_cache.owner_list_cache import OwnerListCache, etag_matches
+from modules.request_timing.request_timing import ServerTimingMiddleware, TimedRoute
+from modules.serialization.serialization import FastJSONResponse
+from modules.worker_channel.worker_channel import WorkerChannel
+from modules.metrics.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedStorage, MetricsMiddleware, MetricsRegistry
+import modules.storage.storage as storage
+import modules.request_timing.request_timing as request_timing
+import modules.serialization.serialization as serialization
+from starlette.concurrency import run_in_threadpool
+import modules.pricing.pricing as pricing
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import hmac
 import uuid
 
-PROJECT_KEY = config("PROJECT_KEY")
+STORAGE_BACKEND = config("STORAGE_BACKEND", default="deta")
+PROJECT_KEY = config("PROJECT_KEY", default=None)
+SQLITE_PATH = config("SQLITE_PATH", default="products.sqlite3")
+COMPONENTS_SERVICE_URL = config("COMPONENTS_SERVICE_URL", default="https://cs-components-service.deta.dev")
+PRICE_REQUEST_TIMEOUT = config("PRICE_REQUEST_TIMEOUT", default=5.0, cast=float)
+PRICE_REQUEST_CONCURRENCY = config("PRICE_REQUEST_CONCURRENCY", default=10, cast=int)
+PRICE_TIMEOUT_BUDGET = config("PRICE_TIMEOUT_BUDGET", default=8.0, cast=float)
+CIRCUIT_FAILURE_RATE_THRESHOLD = config("CIRCUIT_FAILURE_RATE_THRESHOLD", default=0.5, cast=float)
+CIRCUIT_MINIMUM_CALLS = config("CIRCUIT_MINIMUM_CALLS", default=10, cast=int)
+CIRCUIT_WINDOW_SIZE = config("CIRCUIT_WINDOW_SIZE", default=20, cast=int)
+CIRCUIT_OPEN_DURATION = config("CIRCUIT_OPEN_DURATION", default=30.0, cast=float)
+COMPONENTS_BULK_PRICE_PATH = config("COMPONENTS_BULK_PRICE_PATH", default=None)
+COMPONENT_PRICE_CACHE_TTL = config("COMPONENT_PRICE_CACHE_TTL", default=300.0, cast=float)
+COMPONENT_PRICE_CACHE_SIZE = config("COMPONENT_PRICE_CACHE_SIZE", default=10000, cast=int)
+PRODUCT_CACHE_TTL = config("PRODUCT_CACHE_TTL", default=60.0, cast=float)
+PRODUCT_CACHE_SIZE = config("PRODUCT_CACHE_SIZE", default=10000, cast=int)
+OWNER_LIST_CACHE_TTL = config("OWNER_LIST_CACHE_TTL", default=30.0, cast=float)
+OWNER_LIST_CACHE_SIZE = config("OWNER_LIST_CACHE_SIZE", default=1000, cast=int)
+SEARCH_INDEX_TTL = config("SEARCH_INDEX_TTL", default=300.0, cast=float)
+SEARCH_INDEX_SIZE = config("SEARCH_INDEX_SIZE", default=1000, cast=int)
+COMPONENT_INDEX_MAX_AGE = config("COMPONENT_INDEX_MAX_AGE", default=300.0, cast=float)
+ASYNC_PRICING = config("ASYNC_PRICING", default=False, cast=bool)
+PRICING_WORKERS = config("PRICING_WORKERS", default=4, cast=int)
+PRICING_QUEUE_SIZE = config("PRICING_QUEUE_SIZE", default=1000, cast=int)
+PRICING_MAX_ATTEMPTS = config("PRICING_MAX_ATTEMPTS", default=5, cast=int)
+PRICING_RETRY_BASE_DELAY = config("PRICING_RETRY_BASE_DELAY", default=0.5, cast=float)
+PRICING_RETRY_MAX_DELAY = config("PRICING_RETRY_MAX_DELAY", default=30.0, cast=float)
+PRICING_DRAIN_TIMEOUT = config("PRICING_DRAIN_TIMEOUT", default=10.0, cast=float)
+PRICE_WEBHOOK_TOKEN = config("PRICE_WEBHOOK_TOKEN", default=None)
+PRICING_CONCURRENCY = config("PRICING_CONCURRENCY", default=16, cast=int)
+USER_PRICING_RATE = config("USER_PRICING_RATE", default=10.0, cast=float)
+USER_PRICING_BURST = config("USER_PRICING_BURST", default=20.0, cast=float)
+USER_PRICING_QUEUE_SIZE = config("USER_PRICING_QUEUE_SIZE", default=50, cast=int)
+BATCH_MAX_ITEMS = config("BATCH_MAX_ITEMS", default=1000, cast=int)
+BATCH_DB_CONCURRENCY = config("BATCH_DB_CONCURRENCY", default=8, cast=int)
+SERVER_TIMING = config("SERVER_TIMING", default=False, cast=bool)
+DEBUG_TOKEN = config("DEBUG_TOKEN", default=None)
+PROFILE_STORE_SIZE = config("PROFILE_STORE_SIZE", default=20, cast=int)
+PROFILE_STORE_TTL = config("PROFILE_STORE_TTL", default=600.0, cast=float)
+SKIP_RESPONSE_VALIDATION = config("SKIP_RESPONSE_VALIDATION", default=False, cast=bool)
+WORKER_CHANNEL_DIR = config("WORKER_CHANNEL_DIR", default=None)
+WARM_UP_MODELS = config("WARM_UP_MODELS", default=True, cast=bool)
+DETA_PUT_MANY_LIMIT = storage.PUT_MANY_LIMIT
+DETA_FETCH_LIMIT = 1000
+PRICING_PENDING = "pending"
+PRICING_PRICED = "priced"
+PRICING_FAILED = "failed"
+PRICING_STALE = "stale"
+PRODUCT_RESPONSE_ALIASES = serialization.field_aliases(product_models.ProductResponseModel)
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+metrics_registry = MetricsRegistry()
+http_request_duration = metrics_registry.histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests.", ("method", "route", "status"),
+)
+http_requests = metrics_registry.counter(
+    "http_requests_total", "Number of HTTP requests.", ("method", "route", "status"),
+)
+storage_operation_duration = metrics_registry.histogram(
+    "storage_operation_duration_seconds", "Latency of product storage operations.", ("operation",),
+)
+storage_operation_errors = metrics_registry.counter(
+    "storage_operation_errors_total", "Number of failed product storage operations.", ("operation",),
+)
+components_request_duration = metrics_registry.histogram(
+    "components_request_duration_seconds", "Latency of components service price requests.", ("operation",),
+)
+components_request_errors = metrics_registry.counter(
+    "components_request_errors_total", "Number of failed components service price requests.", ("operation", "error"),
+)
+
+
+def observe_components_request(operation:str, duration:float, error:Optional[BaseException]):
+    components_request_duration.observe(duration, operation)
+    if error is not None:
+        components_request_errors.inc(operation, pricing.upstream_error_type(error))
+
+
+productsDB = InstrumentedStorage(
+    storage.LazyStorage(lambda: storage.create_storage(
+        STORAGE_BACKEND,
+        base_name="products",
+        project_key=PROJECT_KEY,
+        sqlite_path=SQLITE_PATH,
+    )),
+    duration=storage_operation_duration,
+    errors=storage_operation_errors,
+)
+product_cache = TTLCache(max_size=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+owner_list_cache = OwnerListCache(max_size=OWNER_LIST_CACHE_SIZE, ttl=OWNER_LIST_CACHE_TTL)
+component_index = ComponentIndex(max_age=COMPONENT_INDEX_MAX_AGE)
+product_search_index = ProductSearchIndex(max_owners=SEARCH_INDEX_SIZE, ttl=SEARCH_INDEX_TTL)
+component_price_cache = TTLCache(max_size=COMPONENT_PRICE_CACHE_SIZE, ttl=COMPONENT_PRICE_CACHE_TTL)
+pricing_admission = AdmissionController(
+    rate=USER_PRICING_RATE,
+    burst=USER_PRICING_BURST,
+    max_concurrency=PRICING_CONCURRENCY,
+    max_queued_per_user=USER_PRICING_QUEUE_SIZE,
+)
+request_profiles = TTLCache(max_size=PROFILE_STORE_SIZE, ttl=PROFILE_STORE_TTL)
+price_client = pricing.ComponentPriceClient(
+    base_url=COMPONENTS_SERVICE_URL,
+    timeout=PRICE_REQUEST_TIMEOUT,
+    max_concurrency=PRICE_REQUEST_CONCURRENCY,
+    cache=component_price_cache,
+    bulk_price_path=COMPONENTS_BULK_PRICE_PATH,
+    circuit_breaker=CircuitBreaker(
+        failure_rate_threshold=CIRCUIT_FAILURE_RATE_THRESHOLD,
+        minimum_calls=CIRCUIT_MINIMUM_CALLS,
+        window_size=CIRCUIT_WINDOW_SIZE,
+        open_duration=CIRCUIT_OPEN_DURATION,
+    ),
+    timeout_budget=PRICE_TIMEOUT_BUDGET,
+    observe_request=observe_components_request,
+)
+caches = {
+    "component_prices": component_price_cache,
+    "products": product_cache,
+    "owner_lists": owner_list_cache,
+    "search_indexes": product_search_index,
+}
+
+
+def collect_cache_stat(stat:str):
+    return lambda: {(name,): cache.stats()[stat] for name, cache in caches.items()}
+
+
+metrics_registry.callback("cache_hits_total", "Number of cache hits.", "counter", ("cache",), collect_cache_stat("hits"))
+metrics_registry.callback("cache_misses_total", "Number of cache misses.", "counter", ("cache",), collect_cache_stat("misses"))
+metrics_registry.callback("cache_evictions_total", "Number of entries evicted from a full cache.", "counter", ("cache",), collect_cache_stat("evictions"))
+metrics_registry.callback("cache_entries", "Number of cached entries.", "gauge", ("cache",), collect_cache_stat("size"))
+metrics_registry.callback("cache_hit_ratio", "Share of cache lookups answered from the cache.", "gauge", ("cache",), collect_cache_stat("hit_ratio"))
+
+
+def collect_circuit_breaker_state():
+    current_state = price_client.circuit_breaker.state
+    return {(state,): int(state == current_state) for state in (CLOSED, OPEN, HALF_OPEN)}
+
+
+def collect_circuit_breaker_stat(stat:str):
+    return lambda: {(): price_client.circuit_breaker.stats()[stat]}
+
+
+metrics_registry.callback("circuit_breaker_state", "State of the components service circuit breaker, 1 for the current state.", "gauge", ("state",), collect_circuit_breaker_state)
+metrics_registry.callback("circuit_breaker_failure_rate", "Failure rate of the recent components service calls.", "gauge", (), collect_circuit_breaker_stat("failure_rate"))
+metrics_registry.callback("circuit_breaker_opened_total", "Number of times the components service circuit breaker opened.", "counter", (), collect_circuit_breaker_stat("times_opened"))
+metrics_registry.callback("circuit_breaker_rejected_calls_total", "Number of components service calls rejected by the open circuit breaker.", "counter", (), collect_circuit_breaker_stat("rejected_calls"))
+
+
+def collect_pricing_admission_stat(stat:str):
+    return lambda: {(): pricing_admission.stats()[stat]}
+
+
+metrics_registry.callback("pricing_admission_active", "Number of pricing calls holding one of the PRICING_CONCURRENCY slots.", "gauge", (), collect_pricing_admission_stat("active"))
+metrics_registry.callback("pricing_admission_waiting", "Number of pricing calls waiting for a token or a free slot.", "gauge", (), collect_pricing_admission_stat("waiting"))
+metrics_registry.callback(
+    "pricing_admission_calls_total",
+    "Number of pricing calls admitted, queued before admission or rejected with 429.",
+    "counter",
+    ("outcome",),
+    lambda: {(outcome,): pricing_admission.stats()[outcome] for outcome in ("admitted", "queued", "rejected")},
+)
+
+def collect_worker_messages():
+    if worker_channel is None:
+        return {}
+    return {(event,): count for event, count in worker_channel.stats().items()}
+
+
+metrics_registry.callback("worker_messages_total", "Number of cache invalidation messages exchanged with other workers.", "counter", ("event",), collect_worker_messages)
 
-deta = Deta(PROJECT_KEY)
-productsDB = deta.Base("products")
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+# Routes are only timed if server timing can be turned on, so there is no overhead otherwise.
+if SERVER_TIMING or DEBUG_TOKEN is not None:
+    app.router.route_class = TimedRoute
 
 origins = [
     "http://localhost",
@@ -26,29 +219,486 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+if SERVER_TIMING or DEBUG_TOKEN is not None:
+    app.add_middleware(ServerTimingMiddleware, enabled=SERVER_TIMING, token=DEBUG_TOKEN, profiles=request_profiles)
+app.add_middleware(MetricsMiddleware, duration=http_request_duration, requests=http_requests)
+
+
+@app.on_event("startup")
+def warm_up_models():
+    # Validates and serializes a product once, so the first request does not build the lazily created
+    # validators and caches. Storage and HTTP clients stay untouched until they are needed.
+    if not WARM_UP_MODELS:
+        return
+    warm_up_product = {"key": "warm-up", "owner_id": "warm-up", "name": "", "description": "", "component_ids": [], "price": 0.0, "version": 1}
+    product_models.ProductRequestModel(productId="warm-up", ownerId="warm-up", name="", description="", componentIds=[])
+    product_models.ProductPatchModel(name="")
+    serialize_products([warm_up_product])
+
+
+@app.on_event("startup")
+async def start_worker_channel():
+    if worker_channel is not None:
+        worker_channel.start()
+
+
+@app.on_event("shutdown")
+async def drain_pricing_queue():
+    await pricing_queue.stop(drain_timeout=PRICING_DRAIN_TIMEOUT)
+
+
+@app.on_event("shutdown")
+def close_worker_channel():
+    if worker_channel is not None:
+        worker_channel.close()
+
+
+@app.on_event("shutdown")
+async def close_price_client():
+    await price_client.aclose()
+
+
+@app.on_event("shutdown")
+def close_products_storage():
+    productsDB.close()
+
+
+@asynccontextmanager
+async def admitted_pricing(user_id:str, cost:int = 1):
+    try:
+        with request_timing.timed("admission"):
+            await pricing_admission.acquire(user_id, cost)
+    except AdmissionRejectedError as error:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many products are priced for this user, retry later.",
+            headers={"Retry-After": error.retry_after_header()},
+        )
+    try:
+        yield
+    finally:
+        pricing_admission.release()
+
+
+async def calculate_product_price(component_ids:list[str], user_id:str) -> pricing.PriceQuote:
+    async with admitted_pricing(user_id):
+        with request_timing.timed("pricing"):
+            return await price_client.quote_price(component_ids)
+
+
+def apply_price_quote(product:dict, quote:pricing.PriceQuote):
+    product["price"] = quote.price
+    product["component_prices"] = quote.component_prices or {}
+    if quote.is_stale:
+        product["pricing_status"] = PRICING_STALE
+
+
+async def calculate_product_price_change(product:dict, component_ids:list[str], user_id:str) -> pricing.PriceQuote:
+    # Products without a current price are priced completely.
+    if product.get("price") is None or product.get("pricing_status") in (PRICING_PENDING, PRICING_FAILED, PRICING_STALE):
+        return await calculate_product_price(component_ids, user_id)
+    try:
+        async with admitted_pricing(user_id):
+            with request_timing.timed("pricing"):
+                return await price_client.quote_price_change(product["component_ids"], product["price"], component_ids, product.get("component_prices"))
+    except HTTPException:
+        raise
+    except Exception:
+        # A removed component may not exist anymore, then the product is priced completely.
+        return await calculate_product_price(component_ids, user_id)
+
+
+def get_cached_product(product_id:str) -> Optional[dict]:
+    cached_product = product_cache.get(product_id)
+    return dict(cached_product) if cached_product is not None else None
+
+
+def read_product(product_id:str) -> Optional[dict]:
+    fetched_product = productsDB.get(product_id)
+    if fetched_product is not None:
+        product_cache.set(product_id, dict(fetched_product))
+    return fetched_product
+
+
+def get_product(product_id:str) -> Optional[dict]:
+    cached_product = get_cached_product(product_id)
+    if cached_product is not None:
+        return cached_product
+    return read_product(product_id)
+
+
+async def load_product(product_id:str) -> Optional[dict]:
+    # Cache hits are answered on the event loop, only storage reads are moved to the threadpool.
+    cached_product = get_cached_product(product_id)
+    if cached_product is not None:
+        return cached_product
+    return await run_in_threadpool(read_product, product_id)
+
+
+def publish_to_workers(message:dict, fallback:dict = None):
+    if worker_channel is not None:
+        worker_channel.publish(message, fallback)
+
+
+def on_product_written(product:dict, previous_product:dict = None):
+    product_cache.set(product["key"], dict(product))
+    component_index.add(product)
+    product_search_index.add(product)
+    owner_list_cache.bump(product["owner_id"])
+    previous_owner_id = previous_product["owner_id"] if previous_product else None
+    if previous_owner_id is not None and previous_owner_id != product["owner_id"]:
+        product_search_index.remove(previous_product)
+        owner_list_cache.bump(previous_owner_id)
+    publish_to_workers(
+        {"type": "product_written", "product": product, "previous_owner_id": previous_owner_id},
+        fallback={"type": "product_invalidated", "key": product["key"], "owner_id": product["owner_id"], "previous_owner_id": previous_owner_id},
+    )
+
+
+def on_product_deleted(product:dict):
+    product_cache.delete(product["key"])
+    component_index.remove(product["key"])
+    product_search_index.remove(product)
+    owner_list_cache.bump(product["owner_id"])
+    publish_to_workers({"type": "product_deleted", "key": product["key"], "owner_id": product["owner_id"]})
+
+
+def apply_worker_message(message:dict):
+    # Changes made by other workers may arrive out of order. Cached products are only dropped,
+    # the search index keeps the highest version and the component index may hold extra products.
+    if message["type"] == "component_price":
+        component_price_cache.set(message["component_id"], message["price"])
+        return
+    if message["type"] == "product_written":
+        product = message["product"]
+        key, owner_id = product["key"], product["owner_id"]
+        component_index.merge(product)
+        product_search_index.add(product)
+    elif message["type"] == "product_invalidated":
+        key, owner_id = message["key"], message["owner_id"]
+        component_index.invalidate()
+        product_search_index.invalidate(owner_id)
+    else:
+        key, owner_id = message["key"], message["owner_id"]
+        component_index.remove(key)
+        product_search_index.remove({"key": key, "owner_id": owner_id})
+    product_cache.delete(key)
+    owner_list_cache.bump(owner_id)
+    previous_owner_id = message.get("previous_owner_id")
+    if previous_owner_id is not None and previous_owner_id != owner_id:
+        product_search_index.remove({"key": key, "owner_id": previous_owner_id})
+        owner_list_cache.bump(previous_owner_id)
+
+
+worker_channel = WorkerChannel(WORKER_CHANNEL_DIR, apply_worker_message) if WORKER_CHANNEL_DIR else None
+
+
+def product_etag(product:dict) -> Optional[str]:
+    version = product.get("version")
+    return f'"{version}"' if version is not None else None
+
+
+def next_version(version:Optional[int]) -> int:
+    return (version or 0) + 1
+
+
+def parse_if_match(if_match:Optional[str]) -> Optional[int]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="If-Match does not match the version of the product.")
+
+
+def raise_for_failed_condition(
+    error:storage.ConditionFailedError,
+    user_id:str,
+    missing_status_code:int = status.HTTP_412_PRECONDITION_FAILED,
+    forbidden_detail:str = "Modifications are only allowed by the owner of the product.",
+):
+    current_product = error.item
+    if current_product is None:
+        if missing_status_code == status.HTTP_404_NOT_FOUND:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found.")
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Product does not exist.")
+    # The cached product is outdated if it was written by another process in the meantime.
+    product_cache.set(current_product["key"], dict(current_product))
+    if current_product["owner_id"] != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=forbidden_detail)
+    etag = product_etag(current_product)
+    raise HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Product was modified, its current version does not match.",
+        headers={"ETag": etag} if etag is not None else None,
+    )
+
+
+def write_product(product:dict, conditions:Optional[dict], current_product:Optional[dict] = None) -> Optional[dict]:
+    if conditions is None:
+        try:
+            productsDB.insert(product)
+        except storage.ItemExistsError:
+            raise storage.ConditionFailedError(f"Product '{product['key']}' already exists", productsDB.get(product["key"]))
+        return None
+    return productsDB.put_if(product, conditions, current_product)
+
+
+def product_write_conditions(user_id:str, stored_product:Optional[dict]) -> Optional[dict]:
+    return {"owner_id": user_id, "version": stored_product.get("version")} if stored_product else None
+
+
+async def price_pending_product(product_key:str):
+    pending_product = await run_in_threadpool(productsDB.get, product_key)
+    if pending_product is None or pending_product.get("pricing_status") != PRICING_PENDING:
+        return
+    quote = await calculate_product_price(pending_product["component_ids"], pending_product["owner_id"])
+    priced_fields = {
+        "price": quote.price,
+        "pricing_status": PRICING_STALE if quote.is_stale else PRICING_PRICED,
+        "component_prices": quote.component_prices or {},
+        "version": next_version(pending_product.get("version")),
+    }
+    # The product may have been changed or deleted while it was priced.
+    try:
+        await run_in_threadpool(productsDB.update_if, priced_fields, product_key, {"version": pending_product.get("version")}, pending_product)
+    except storage.ConditionFailedError as error:
+        # A partial update without new components leaves the product pending, the queue retries it.
+        if error.item is not None and error.item.get("pricing_status") == PRICING_PENDING:
+            raise
+        return
+    on_product_written({**pending_product, **priced_fields}, pending_product)
+
+
+async def mark_pricing_failed(product_key:str):
+    while True:
+        pending_product = await run_in_threadpool(productsDB.get, product_key)
+        if pending_product is None or pending_product.get("pricing_status") != PRICING_PENDING:
+            return
+        failed_fields = {"pricing_status": PRICING_FAILED, "version": next_version(pending_product.get("version"))}
+        try:
+            await run_in_threadpool(productsDB.update_if, failed_fields, product_key, {"version": pending_product.get("version")}, pending_product)
+        except storage.ConditionFailedError:
+            continue
+        on_product_written({**pending_product, **failed_fields}, pending_product)
+        return
+
+
+pricing_queue = PricingQueue(
+    price_product=price_pending_product,
+    mark_failed=mark_pricing_failed,
+    workers=PRICING_WORKERS,
+    max_size=PRICING_QUEUE_SIZE,
+    max_attempts=PRICING_MAX_ATTEMPTS,
+    retry_base_delay=PRICING_RETRY_BASE_DELAY,
+    retry_max_delay=PRICING_RETRY_MAX_DELAY,
+)
+
+
+def wants_async_pricing(prefer:Optional[str]) -> bool:
+    return ASYNC_PRICING or (prefer is not None and "respond-async" in prefer)
+
+
+def check_pricing_queue_capacity():
+    if pricing_queue.is_full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many products are waiting to be priced.",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def queue_product_pricing(product_key:str) -> dict:
+    try:
+        pricing_queue.submit(product_key)
+    except PricingQueueFullError:
+        # The product is already stored, if it cannot be priced now it stays pending and is queued again on a status request.
+        try:
+            await price_pending_product(product_key)
+        except Exception:
+            pass
+    return {
+        "Location": f"/products/{product_key}/pricing-status",
+        "Preference-Applied": "respond-async",
+    }
+
+
+async def gather_in_threadpool(func, args_list:list, max_concurrency:int) -> list:
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async def run(args):
+        async with semaphore:
+            return await run_in_threadpool(func, *args)
+    return await asyncio.gather(*(run(args) for args in args_list), return_exceptions=True)
+
+
+@app.get(
+    "/cache/stats",
+    response_model=dict[str, cache_models.CacheStatsModel],
+    response_description="Returns hit, miss and eviction counters per cache.",
+    description="Get usage statistics of the in-process caches.",
+)
+async def get_cache_stats():
+    return {
+        "componentPrices": component_price_cache.stats(),
+        "products": product_cache.stats(),
+        "ownerLists": owner_list_cache.stats(),
+        "searchIndexes": product_search_index.stats(),
+    }
+
+
+@app.get(
+    "/metrics",
+    response_class=Response,
+    response_description="Returns the metrics in the Prometheus text format.",
+    description="Get request, storage, components service, cache and circuit breaker metrics.",
+)
+async def get_metrics():
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get(
+    "/debug/profiles/{profile_id}",
+    response_class=Response,
+    include_in_schema=False,
+)
+async def get_request_profile(profile_id:str, debug_token:str = Header(default=None, alias="X-Debug-Token")):
+    if not request_timing.is_valid_debug_token(debug_token, DEBUG_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid debug token.")
+    profile = request_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found.")
+    return Response(content=profile, media_type="text/plain")
+
+
+def fetch_all_pages(query:dict, last:str = None):
+    while True:
+        page = productsDB.fetch(query, limit=DETA_FETCH_LIMIT, last=last)
+        yield page.items
+        last = page.last
+        if last is None:
+            return
+
+
+def fetch_all_products(query:dict, last:str = None) -> list[dict]:
+    return [item for items in fetch_all_pages(query, last) for item in items]
 
 
-def calculate_product_price(component_ids:list[str]) -> float:
-    components_price_sum = 0
-    for componentId in component_ids:
-        component_price_response = requests.get(f"https://cs-components-service.deta.dev/components/{componentId}/price")
-        components_price_sum = components_price_sum + component_price_response.json()["price"]
-    return components_price_sum
+def product_response(product:dict) -> dict:
+    # Stored products are written by this service only, so their validation can be skipped.
+    if SKIP_RESPONSE_VALIDATION:
+        return serialization.to_aliases(product, PRODUCT_RESPONSE_ALIASES)
+    return product_models.ProductResponseModel(**product).dict(by_alias=True, exclude_unset=True)
+
+
+def serialize_products(products:list[dict]) -> bytes:
+    return serialization.dumps([product_response(product) for product in products])
+
+
+def read_serialized_products_for_owner(owner_id:str) -> tuple[bytes, str]:
+    version = owner_list_cache.version(owner_id)
+    products = fetch_all_products({"owner_id": owner_id})
+    with request_timing.timed("serialize"):
+        body = serialize_products(products)
+    return body, owner_list_cache.set(owner_id, version, body)
+
+
+async def get_serialized_products_for_owner(owner_id:str) -> tuple[bytes, str]:
+    cached_list = owner_list_cache.get(owner_id)
+    if cached_list is not None:
+        return cached_list
+    return await run_in_threadpool(read_serialized_products_for_owner, owner_id)
+
+
+def load_product_search_index(owner_id:str):
+    product_search_index.start_load(owner_id)
+    try:
+        products = fetch_all_products({"owner_id": owner_id})
+    except Exception:
+        product_search_index.cancel_load(owner_id)
+        raise
+    return product_search_index.finish_load(owner_id, products)
+
+
+async def search_products_for_owner(owner_id:str, query:ProductQuery) -> Response:
+    with request_timing.timed("search"):
+        result = product_search_index.search(owner_id, query)
+    if result is None:
+        owner_products = await run_in_threadpool(load_product_search_index, owner_id)
+        with request_timing.timed("search"):
+            result = product_search_index.search_products(owner_products, query)
+    with request_timing.timed("serialize"):
+        body = serialize_products(result.products)
+    return Response(content=body, media_type="application/json", headers={"X-Total-Count": str(result.total)})
+
+
+def stream_products(query:dict, stream_format:str, last:str = None):
+    if stream_format == "json":
+        yield b"["
+    separator = b""
+    for items in fetch_all_pages(query, last):
+        for item in items:
+            product_json = serialization.dumps(product_response(item))
+            if stream_format == "json":
+                yield separator + product_json
+                separator = b","
+            else:
+                yield product_json + b"\n"
+    if stream_format == "json":
+        yield b"]"
 
 
 @app.get(
     "/products",
     response_model=list[product_models.ProductResponseModel],
-    response_description="Returns list with products",
-    description="Get all products belonging to a user.",    
+    response_model_exclude_unset=True,
+    response_description="Returns list with products. If a limit is given, the X-Last-Key header holds the cursor of the next page. Filtered or sorted lists carry the number of all matching products in the X-Total-Count header.",
+    responses={304 :{
+            "description": "Returned without body if the list still matches the ETag sent in If-None-Match."
+        },
+        422 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if filters or sorting are combined with last or stream."
+        }},
+    description="Get all products belonging to a user, either completely, page by page or streamed as NDJSON or JSON array. Filtering by name prefix, name substring, price range or component and sorting by price or name is answered from an in-memory index of the user's products, limit then caps the number of returned products.",    
 )
-async def get_products_for_user(user_id: str = Header(alias="userId")):
-    return productsDB.fetch({"owner_id": user_id}).items
+async def get_products_for_user(
+    user_id: str = Header(alias="userId"),
+    limit: int = Query(default=None, ge=1, le=DETA_FETCH_LIMIT),
+    last: str = Query(default=None),
+    stream: str = Query(default=None, regex="^(ndjson|json)$"),
+    name_prefix: str = Query(default=None, alias="namePrefix", min_length=1),
+    name_contains: str = Query(default=None, alias="nameContains", min_length=1),
+    min_price: float = Query(default=None, alias="minPrice"),
+    max_price: float = Query(default=None, alias="maxPrice"),
+    component_id: str = Query(default=None, alias="componentId"),
+    sort: str = Query(default=None, regex="^-?(price|name)$"),
+    if_none_match: str = Header(default=None, alias="If-None-Match"),
+):
+    search_query = ProductQuery(name_prefix, name_contains, min_price, max_price, component_id, sort, limit)
+    if any(value is not None for value in search_query[:-1]):
+        if last is not None or stream is not None:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Filters and sorting cannot be combined with last or stream.")
+        return await search_products_for_owner(user_id, search_query)
+    query = {"owner_id": user_id}
+    if stream is not None:
+        return StreamingResponse(stream_products(query, stream, last), media_type=STREAM_MEDIA_TYPES[stream])
+    if limit is not None:
+        page = await run_in_threadpool(productsDB.fetch, query, limit, last)
+        headers = {"X-Last-Key": page.last} if page.last is not None else None
+        return Response(content=serialize_products(page.items), media_type="application/json", headers=headers)
+    if last is not None:
+        products = await run_in_threadpool(fetch_all_products, query, last)
+        return Response(content=serialize_products(products), media_type="application/json")
+    body, etag = await get_serialized_products_for_owner(user_id)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @app.get(
     "/products/{product_id}", 
     response_model=product_models.ProductResponseModel,
+    response_model_exclude_unset=True,
     response_description="Returns product",
     responses={
         403 :{
@@ -61,9 +711,9 @@ async def get_products_for_user(user_id: str = Header(alias="userId")):
         }},
     description="Get a product by its id, belonging to the user."
 )
-async def get_product_by_id(product_id, user_id:str = Header(alias="userId")):
+async def get_product_by_id(product_id, response: Response, user_id:str = Header(alias="userId")):
     try:
-        fetched_product = productsDB.get(product_id)
+        fetched_product = await load_product(product_id)
     except Exception as ex:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ex))
 
@@ -71,79 +721,255 @@ async def get_product_by_id(product_id, user_id:str = Header(alias="userId")):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found.")
     elif fetched_product["owner_id"] != user_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not allowed to get a product not owned.")
-    else:       
-        return fetched_product
+    etag = product_etag(fetched_product)
+    headers = {"ETag": etag} if etag is not None else {}
+    if SKIP_RESPONSE_VALIDATION:
+        return FastJSONResponse(content=serialization.to_aliases(fetched_product, PRODUCT_RESPONSE_ALIASES), headers=headers)
+    response.headers.update(headers)
+    return fetched_product
+
+
+@app.get(
+    "/products/{product_id}/pricing-status",
+    response_model=product_models.PricingStatusModel,
+    response_model_exclude_none=True,
+    response_description="Returns the pricing status of the product and the number of pricing attempts made in the background.",
+    responses={
+        403 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if user tries to get the pricing status of a product owned by a different user."
+            },
+        404 :{
+                "model": error_models.HTTPErrorModel,
+                "description": "Error raised if the product cant be found."
+        }},
+    description="Get the pricing status of a product, which is pending, priced, stale or failed."
+)
+async def get_product_pricing_status(product_id, user_id:str = Header(alias="userId")):
+    fetched_product = await load_product(product_id)
+    if fetched_product is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found.")
+    if fetched_product["owner_id"] != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not allowed to get a product not owned.")
+    job = pricing_queue.status(product_id)
+    if job is None and fetched_product.get("pricing_status") == PRICING_PENDING:
+        # The job of a pending product was lost, e.g. by a restart, so it is queued again.
+        try:
+            pricing_queue.submit(product_id)
+            job = pricing_queue.status(product_id)
+        except PricingQueueFullError:
+            pass
+    job = job or {}
+    return {
+        "product_id": product_id,
+        "pricing_status": fetched_product.get("pricing_status", PRICING_PRICED),
+        "attempts": job.get("attempts"),
+    }
+
+
+def check_batch_size(products:list):
+    if len(products) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch may contain at most {BATCH_MAX_ITEMS} products.",
+        )
+
+
+@app.post(
+    "/products:lookup",
+    response_model=product_models.ProductLookupResponseModel,
+    response_model_exclude_unset=True,
+    response_description="Returns the found products of the user and the ids of missing products and products owned by a different user.",
+    responses={413 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if more product ids are requested than allowed."
+        }},
+    description="Get many products of a user by their ids at once.",
+)
+async def lookup_products_by_user(lookup: product_models.ProductLookupRequestModel, user_id:str = Header(alias="userId")):
+    check_batch_size(lookup.product_ids)
+    product_ids = list(dict.fromkeys(lookup.product_ids))
+    fetched_products = await gather_in_threadpool(get_product, [(product_id,) for product_id in product_ids], BATCH_DB_CONCURRENCY)
+    products = []
+    missing_ids = []
+    forbidden_ids = []
+    for product_id, fetched_product in zip(product_ids, fetched_products):
+        if isinstance(fetched_product, Exception):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(fetched_product))
+        if fetched_product is None:
+            missing_ids.append(product_id)
+        elif fetched_product["owner_id"] != user_id:
+            forbidden_ids.append(product_id)
+        else:
+            products.append(product_response(fetched_product))
+    return FastJSONResponse(content={"products": products, "missingIds": missing_ids, "forbiddenIds": forbidden_ids})
 
 
 @app.post(
     "/products",
     status_code=status.HTTP_201_CREATED,
     response_model=product_models.ProductResponseModel,
+    response_model_exclude_unset=True,
     response_description="Returns created product with generated id.",
-    responses={403 :{
+    responses={
+        202 :{
+            "model": product_models.ProductResponseModel,
+            "description": "Returned if the product is stored and will be priced in the background."
+            },
+        403 :{
             "model": error_models.HTTPErrorModel,
             "description": "Error raised if user tries to create a product for a different owner."
+            },
+        429 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the user has too many pricing calls waiting, the Retry-After header holds the seconds to wait."
+            },
+        503 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if too many products are waiting to be priced in the background."
         }},
-    description="Create a new product for a user",
+    description="Create a new product for a user. With the header 'Prefer: respond-async' the product is priced in the background.",
 )
-async def post_product_by_user(product: product_models.ProductModel, user_id:str = Header(alias="userId")):
+async def post_product_by_user(
+    product: product_models.ProductModel,
+    response: Response,
+    user_id:str = Header(alias="userId"),
+    prefer:str = Header(default=None),
+):
     if(product.dict()["owner_id"]!=user_id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Users are only allowed to create products for themselves.")
+    async_pricing = wants_async_pricing(prefer)
+    if async_pricing:
+        check_pricing_queue_capacity()
     try:
         new_product = product.dict()
         new_product["key"] = str(uuid.uuid1())
-        new_product["price"] = calculate_product_price(new_product["component_ids"])
-        productsDB.insert(new_product)
+        new_product["version"] = 1
+        if async_pricing:
+            new_product["price"] = None
+            new_product["pricing_status"] = PRICING_PENDING
+        else:
+            apply_price_quote(new_product, await calculate_product_price(new_product["component_ids"], user_id))
+        await run_in_threadpool(productsDB.insert, new_product)
+    except HTTPException:
+        raise
     except Exception as ex:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=ex)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ex))
+    on_product_written(new_product)
+    response.headers["ETag"] = product_etag(new_product)
+    if async_pricing:
+        response.headers.update(await queue_product_pricing(new_product["key"]))
+        response.status_code = status.HTTP_202_ACCEPTED
     return new_product
 
 
 @app.delete(
     "/products/{product_id}",
     status_code=status.HTTP_204_NO_CONTENT,
-    responses={403 :{
+    responses={
+        403 :{
             "model": error_models.HTTPErrorModel,
             "description": "Error raised if user tries to delete a product not owned."
+            },
+        412 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the product does not have the version sent in If-Match."
         }},
-    description="Deletes a product by its id, if the user is the owner.",
+    description="Deletes a product by its id, if the user is the owner. With an If-Match header holding the product version, the product is only deleted if it was not modified.",
 )
-async def delete_product_by_id(product_id, user_id: str = Header(alias="userId")):
-    product_to_delete = productsDB.get(product_id)
-    if product_to_delete is None:
-        return
-    if product_to_delete["owner_id"] == user_id:
-        productsDB.delete(product_id)
-        return
-    else:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not allowed to delete a product not owned.")
+async def delete_product_by_id(
+    product_id,
+    user_id: str = Header(alias="userId"),
+    if_match: str = Header(default=None, alias="If-Match"),
+):
+    if_match_version = parse_if_match(if_match)
+    # The conditional delete checks the owner, so the product is not read before.
+    conditions = {"owner_id": user_id}
+    if if_match_version is not None:
+        conditions["version"] = if_match_version
+    try:
+        deleted_product = await run_in_threadpool(productsDB.delete_if, product_id, conditions)
+    except storage.ConditionFailedError as error:
+        if error.item is None:
+            product_cache.delete(product_id)
+            return
+        raise_for_failed_condition(error, user_id, forbidden_detail="User is not allowed to delete a product not owned.")
+    on_product_deleted(deleted_product)
 
 
 @app.put(
     "/products",
     status_code=status.HTTP_201_CREATED,
     response_model=product_models.ProductResponseModel,
+    response_model_exclude_unset=True,
     response_description="Returns created or updated product.",
-    responses={403 :{
+    responses={
+        202 :{
+            "model": product_models.ProductResponseModel,
+            "description": "Returned if the product is stored and will be priced in the background."
+            },
+        403 :{
             "model": error_models.HTTPErrorModel,
             "description": "Error raised if user tries to create or update a product not owned."
+            },
+        412 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the product was modified concurrently or does not have the version sent in If-Match."
+            },
+        429 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the user has too many pricing calls waiting, the Retry-After header holds the seconds to wait."
+            },
+        503 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if too many products are waiting to be priced in the background."
         }},
-    description="Creates a new product if not existing, else updates product with values in request body.",
+    description="Creates a new product if not existing, else updates product with values in request body. With an If-Match header holding the product version, the product is updated without reading it first and only if it was not modified. With the header 'Prefer: respond-async' the product is priced in the background.",
 )
-async def put_product_by_user(product: product_models.ProductRequestModel, user_id: str = Header(alias="userId")):
-    product_to_update = productsDB.get(product.dict()["key"])
-    if product_to_update and product_to_update["owner_id"] != user_id:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Modifications are only allowed by the owner of the product.")
+async def put_product_by_user(
+    product: product_models.ProductRequestModel,
+    response: Response,
+    user_id: str = Header(alias="userId"),
+    prefer: str = Header(default=None),
+    if_match: str = Header(default=None, alias="If-Match"),
+):
+    if_match_version = parse_if_match(if_match)
+    product_to_update = None
+    if if_match_version is not None and product.owner_id == user_id:
+        # The client sent the current version, so ownership and version are only checked by the conditional write.
+        conditions = {"owner_id": user_id, "version": if_match_version}
     else:
+        product_to_update = await run_in_threadpool(productsDB.get, product.key)
+        if product_to_update and product_to_update["owner_id"] != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Modifications are only allowed by the owner of the product.")
         if(product.dict()["owner_id"]!=user_id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Users are only allowed to create products for themselves.")
-        try:
-            new_or_updated_product = product.dict()
-            new_or_updated_product["price"] = calculate_product_price(component_ids=new_or_updated_product["component_ids"])
-            productsDB.put(new_or_updated_product)
-        except Exception as ex:
-            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ex))
-        return new_or_updated_product
+        conditions = product_write_conditions(user_id, product_to_update)
+    async_pricing = wants_async_pricing(prefer)
+    if async_pricing:
+        check_pricing_queue_capacity()
+    try:
+        new_or_updated_product = product.dict()
+        new_or_updated_product["version"] = next_version(conditions["version"] if conditions else None)
+        if async_pricing:
+            new_or_updated_product["price"] = None
+            new_or_updated_product["pricing_status"] = PRICING_PENDING
+        else:
+            apply_price_quote(new_or_updated_product, await calculate_product_price(new_or_updated_product["component_ids"], user_id))
+        # The product read above is passed along, so it is not read again for the conditional write.
+        product_to_update = await run_in_threadpool(write_product, new_or_updated_product, conditions, product_to_update)
+    except storage.ConditionFailedError as error:
+        raise_for_failed_condition(error, user_id)
+    except HTTPException:
+        raise
+    except Exception as ex:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ex))
+    on_product_written(new_or_updated_product, product_to_update)
+    response.headers["ETag"] = product_etag(new_or_updated_product)
+    if async_pricing:
+        response.headers.update(await queue_product_pricing(new_or_updated_product["key"]))
+        response.status_code = status.HTTP_202_ACCEPTED
+    return new_or_updated_product
 
 
 @app.patch(
@@ -151,6 +977,9 @@ async def put_product_by_user(product: product_models.ProductRequestModel, user_
     status_code=status.HTTP_204_NO_CONTENT,
     response_description="Returns no data.",
     responses={
+        202 :{
+            "description": "Returned without body if the product is updated and will be priced in the background."
+            },
         403 :{
             "model": error_models.HTTPErrorModel,
             "description": "Error raised if user tries to update a product not owned."
@@ -158,20 +987,313 @@ async def put_product_by_user(product: product_models.ProductRequestModel, user_
         404 :{
                 "model": error_models.HTTPErrorModel,
                 "description": "Error raised if the product to update cant be found."
+            },
+        412 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the product was modified concurrently or does not have the version sent in If-Match."
+            },
+        429 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the user has too many pricing calls waiting, the Retry-After header holds the seconds to wait."
+            },
+        503 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if too many products are waiting to be priced in the background."
         }},
-    description="Updates product with values specified in request body.",
+    description="Updates the fields specified in the request body, omitted fields are kept. The product is only priced again if its components change, then just the added and removed components are priced. With an If-Match header holding the product version, the product is updated only if it was not modified and, unless its components change, without reading it first. With the header 'Prefer: respond-async' the product is priced in the background.",
 )
-async def patch_product_by_id(product: product_models.ProductModel, product_id, user_id: str = Header(alias="userId")):
-    product_to_update = productsDB.get(product_id)
-    if(product_to_update == None):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found.")
-    elif product_to_update["owner_id"] != user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Modifications are only allowed by the owner of the product.")
+async def patch_product_by_id(
+    product: product_models.ProductPatchModel,
+    product_id,
+    response: Response,
+    user_id: str = Header(alias="userId"),
+    prefer: str = Header(default=None),
+    if_match: str = Header(default=None, alias="If-Match"),
+):
+    if_match_version = parse_if_match(if_match)
+    changed_fields = product.dict(exclude_unset=True)
+    if if_match_version is not None and changed_fields and "component_ids" not in changed_fields:
+        product_to_update = None
+        conditions = {"owner_id": user_id, "version": if_match_version}
+    else:
+        # Read from storage, a cached copy may miss changes that make the patch necessary.
+        product_to_update = await run_in_threadpool(productsDB.get, product_id)
+        if(product_to_update == None):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found.")
+        elif product_to_update["owner_id"] != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Modifications are only allowed by the owner of the product.")
+        conditions = {"owner_id": user_id, "version": product_to_update.get("version") if if_match_version is None else if_match_version}
+        changed_fields = {field: value for field, value in changed_fields.items() if product_to_update.get(field) != value}
+        if not changed_fields:
+            if if_match_version is not None and product_to_update.get("version") != if_match_version:
+                raise_for_failed_condition(storage.ConditionFailedError("Product was modified", product_to_update), user_id)
+            etag = product_etag(product_to_update)
+            if etag is not None:
+                response.headers["ETag"] = etag
+            return
+    async_pricing = "component_ids" in changed_fields and wants_async_pricing(prefer)
+    if async_pricing:
+        check_pricing_queue_capacity()
+    try:
+        updated_fields = dict(changed_fields)
+        updated_fields["version"] = next_version(conditions["version"])
+        if async_pricing:
+            updated_fields["price"] = None
+            updated_fields["pricing_status"] = PRICING_PENDING
+        elif "component_ids" in changed_fields:
+            if "pricing_status" in product_to_update:
+                updated_fields["pricing_status"] = PRICING_PRICED
+            apply_price_quote(updated_fields, await calculate_product_price_change(product_to_update, changed_fields["component_ids"], user_id))
+        product_to_update = await run_in_threadpool(productsDB.update_if, updated_fields, product_id, conditions, product_to_update)
+    except storage.ConditionFailedError as error:
+        raise_for_failed_condition(error, user_id, missing_status_code=status.HTTP_404_NOT_FOUND)
+    except HTTPException:
+        raise
+    except Exception as ex:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ex))
+    on_product_written({**product_to_update, **updated_fields}, product_to_update)
+    response.headers["ETag"] = product_etag(updated_fields)
+    if async_pricing:
+        return Response(
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={"ETag": product_etag(updated_fields), **await queue_product_pricing(product_id)},
+        )
+
+
+def failed_put_many_keys(put_many_result) -> set[str]:
+    if not isinstance(put_many_result, dict):
+        return set()
+    return {item["key"] for item in put_many_result.get("failed", {}).get("items", [])}
+
+
+async def put_products_in_chunks(products:list[dict]) -> list:
+    chunks = [products[start:start + DETA_PUT_MANY_LIMIT] for start in range(0, len(products), DETA_PUT_MANY_LIMIT)]
+    chunk_results = await gather_in_threadpool(productsDB.put_many, [(chunk,) for chunk in chunks], BATCH_DB_CONCURRENCY)
+    return list(zip(chunks, chunk_results))
+
+
+async def price_and_store_batch(products_to_store:dict[int, dict], results:dict[int, dict], user_id:str, previous_products:dict[int, Optional[dict]] = None):
+    component_ids = [component_id for product in products_to_store.values() for component_id in product["component_ids"]]
+    # A batch counts as one pricing call per product, beyond the burst the user has to wait for it afterwards.
+    async with admitted_pricing(user_id, cost=max(1, len(products_to_store))):
+        with request_timing.timed("pricing"):
+            lookup = await price_client.lookup_prices(component_ids, return_exceptions=True)
+    prices = lookup.prices
+
+    priced_products = {}
+    for index, product in products_to_store.items():
+        price_errors = [prices[component_id] for component_id in product["component_ids"] if isinstance(prices[component_id], Exception)]
+        if price_errors:
+            results[index] = {"index": index, "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": str(price_errors[0])}
+        else:
+            is_stale = any(component_id in lookup.stale_ids for component_id in product["component_ids"])
+            component_prices = {component_id: prices[component_id] for component_id in product["component_ids"]}
+            apply_price_quote(product, pricing.PriceQuote(pricing.sum_component_prices(product["component_ids"], prices), is_stale, component_prices))
+            priced_products[index] = product
+
+    if previous_products is None:
+        await put_new_products(priced_products, results)
     else:
+        await put_products_if_unchanged(priced_products, results, user_id, previous_products)
+
+
+async def put_new_products(priced_products:dict[int, dict], results:dict[int, dict]):
+    indexes = {id(product): index for index, product in priced_products.items()}
+    for chunk, chunk_result in await put_products_in_chunks(list(priced_products.values())):
+        failed_keys = failed_put_many_keys(chunk_result)
+        for product in chunk:
+            index = indexes[id(product)]
+            if isinstance(chunk_result, Exception):
+                results[index] = {"index": index, "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": str(chunk_result)}
+            elif product["key"] in failed_keys:
+                results[index] = {"index": index, "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": "Product could not be stored."}
+            else:
+                results[index] = {"index": index, "status_code": status.HTTP_201_CREATED, "product": product}
+                on_product_written(product)
+
+
+async def put_products_if_unchanged(priced_products:dict[int, dict], results:dict[int, dict], user_id:str, previous_products:dict[int, Optional[dict]]):
+    # Every product is written on condition that it still has the version read, so concurrent writes are not lost.
+    indexes = list(priced_products)
+    write_results = await gather_in_threadpool(
+        write_product,
+        [(priced_products[index], product_write_conditions(user_id, previous_products[index]), previous_products[index]) for index in indexes],
+        BATCH_DB_CONCURRENCY,
+    )
+    for index, write_result in zip(indexes, write_results):
+        product = priced_products[index]
+        if isinstance(write_result, storage.ConditionFailedError):
+            results[index] = {"index": index, "status_code": status.HTTP_412_PRECONDITION_FAILED, "detail": "Product was modified concurrently."}
+        elif isinstance(write_result, Exception):
+            results[index] = {"index": index, "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": str(write_result)}
+        else:
+            results[index] = {"index": index, "status_code": status.HTTP_201_CREATED, "product": product}
+            on_product_written(product, write_result)
+
+
+@app.post(
+    "/products:batch",
+    response_model=product_models.BatchResponseModel,
+    response_model_exclude_none=True,
+    response_description="Returns the created product or an error for every item, in request order.",
+    responses={413 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the batch contains more products than allowed."
+            },
+        429 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the user has too many pricing calls waiting, the Retry-After header holds the seconds to wait."
+        }},
+    description="Create many new products for a user at once.",
+)
+async def post_products_batch_by_user(products: list[product_models.ProductModel], user_id:str = Header(alias="userId")):
+    check_batch_size(products)
+    results = {}
+    products_to_store = {}
+    for index, product in enumerate(products):
+        if product.owner_id != user_id:
+            results[index] = {"index": index, "status_code": status.HTTP_403_FORBIDDEN, "detail": "Users are only allowed to create products for themselves."}
+        else:
+            new_product = product.dict()
+            new_product["key"] = str(uuid.uuid1())
+            new_product["version"] = 1
+            products_to_store[index] = new_product
+    await price_and_store_batch(products_to_store, results, user_id)
+    return {"results": [results[index] for index in range(len(products))]}
+
+
+@app.put(
+    "/products:batch",
+    response_model=product_models.BatchResponseModel,
+    response_model_exclude_none=True,
+    response_description="Returns the created or updated product or an error for every item, in request order.",
+    responses={413 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the batch contains more products than allowed."
+            },
+        429 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the user has too many pricing calls waiting, the Retry-After header holds the seconds to wait."
+        }},
+    description="Creates or updates many products of a user at once.",
+)
+async def put_products_batch_by_user(products: list[product_models.ProductRequestModel], user_id:str = Header(alias="userId")):
+    check_batch_size(products)
+    results = {}
+    products_to_store = {}
+    key_counts = Counter(product.key for product in products)
+    for index, product in enumerate(products):
+        if key_counts[product.key] > 1:
+            results[index] = {"index": index, "status_code": status.HTTP_409_CONFLICT, "detail": "Product id occurs more than once in the batch."}
+        elif product.owner_id != user_id:
+            results[index] = {"index": index, "status_code": status.HTTP_403_FORBIDDEN, "detail": "Users are only allowed to create products for themselves."}
+        else:
+            products_to_store[index] = product.dict()
+
+    stored_products = await gather_in_threadpool(
+        productsDB.get,
+        [(product["key"],) for product in products_to_store.values()],
+        BATCH_DB_CONCURRENCY,
+    )
+    previous_products = {}
+    for index, stored_product in zip(list(products_to_store), stored_products):
+        if stored_product and not isinstance(stored_product, Exception):
+            previous_products[index] = stored_product
+            products_to_store[index]["version"] = next_version(stored_product.get("version"))
+        else:
+            previous_products[index] = None
+            products_to_store[index]["version"] = 1
+        if isinstance(stored_product, Exception):
+            results[index] = {"index": index, "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": str(stored_product)}
+            del products_to_store[index]
+        elif stored_product and stored_product["owner_id"] != user_id:
+            results[index] = {"index": index, "status_code": status.HTTP_403_FORBIDDEN, "detail": "Modifications are only allowed by the owner of the product."}
+            del products_to_store[index]
+    await price_and_store_batch(products_to_store, results, user_id, previous_products)
+    return {"results": [results[index] for index in range(len(products))]}
+
+
+def build_component_index():
+    component_index.start_build()
+    try:
+        products = fetch_all_products(None)
+    except Exception:
+        component_index.invalidate()
+        raise
+    component_index.finish_build(products)
+
+
+def reprice_stored_product(product_key:str, component_id:str, price:float, previous_price:float) -> Optional[tuple[dict, dict]]:
+    while True:
+        stored_product = productsDB.get(product_key)
+        if stored_product is None or stored_product["price"] is None or component_id not in stored_product["component_ids"]:
+            return None
+        # The product knows the component price its price is based on, so a replayed webhook changes nothing.
+        component_prices = stored_product.get("component_prices") or {}
+        applied_price = component_prices.get(component_id, previous_price)
+        if applied_price == price:
+            return None
+        component_count = stored_product["component_ids"].count(component_id)
+        updated_fields = {
+            "price": stored_product["price"] + component_count * (price - applied_price),
+            "component_prices": {**component_prices, component_id: price},
+            "version": next_version(stored_product.get("version")),
+        }
         try:
-            updated_product = product.dict()
-            updated_product["price"] = calculate_product_price(component_ids=updated_product["component_ids"])
-            productsDB.update(updated_product,product_id)
-        except Exception as ex:
-            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ex))
-        
\ No newline at end of file
+            productsDB.update_if(updated_fields, product_key, {"version": stored_product.get("version")}, stored_product)
+        except storage.ConditionFailedError:
+            # Written concurrently, the product is read again.
+            continue
+        return {**stored_product, **updated_fields}, stored_product
+
+
+@app.put(
+    "/components/{component_id}/price",
+    response_model=product_models.ComponentPriceChangeResultModel,
+    response_description="Returns the ids of all products whose stored price was updated or could not be updated.",
+    responses={
+        403 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the webhook token is missing or wrong."
+            },
+        409 :{
+            "model": error_models.HTTPErrorModel,
+            "description": "Error raised if the previous price of the component is neither sent nor cached."
+        }},
+    description="Webhook for price changes of a component. Adjusts the stored price of every product containing the component without requesting the components service. Products already priced with the new component price are left unchanged, so the webhook can be sent again.",
+)
+async def put_component_price(
+    component_id:str,
+    price_change: product_models.ComponentPriceChangeModel,
+    webhook_token: str = Header(default=None, alias="X-Webhook-Token"),
+):
+    # Without a configured token the webhook is closed.
+    if PRICE_WEBHOOK_TOKEN is None or webhook_token is None or not hmac.compare_digest(webhook_token, PRICE_WEBHOOK_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid webhook token.")
+    previous_price = price_change.previous_price
+    if previous_price is None:
+        previous_price = component_price_cache.peek(component_id)
+    if previous_price is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Previous price of the component is unknown, it has to be sent as previousPrice.")
+    component_price_cache.set(component_id, price_change.price)
+    publish_to_workers({"type": "component_price", "component_id": component_id, "price": price_change.price})
+
+    if not component_index.is_built:
+        await run_in_threadpool(build_component_index)
+    product_keys = sorted(component_index.product_keys(component_id))
+    results = await gather_in_threadpool(reprice_stored_product, [(key, component_id, price_change.price, previous_price) for key in product_keys], BATCH_DB_CONCURRENCY)
+
+    updated_product_ids = []
+    failed_product_ids = []
+    for product_key, result in zip(product_keys, results):
+        if isinstance(result, Exception):
+            failed_product_ids.append(product_key)
+        elif result is not None:
+            product, previous_product = result
+            on_product_written(product, previous_product)
+            updated_product_ids.append(product_key)
+    return {
+        "component_id": component_id,
+        "updated_product_ids": updated_product_ids,
+        "failed_product_ids": failed_product_ids,
+    }
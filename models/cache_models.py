@@ -0,0 +1,10 @@
+from models.custom_base_model import CustomBaseModel
+
+class CacheStatsModel(CustomBaseModel):
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
@@ -1,5 +1,6 @@
 from models.custom_base_model import CustomBaseModel
-from pydantic import Field
+from pydantic import Extra, Field, validator
+from typing import Optional
 
 class ProductModel(CustomBaseModel):
     owner_id: str
@@ -12,9 +13,56 @@ class ProductModel(CustomBaseModel):
 
 class ProductResponseModel(ProductModel):
     key: str = Field(alias="productId")
-    price: float
+    price: Optional[float]
+    pricing_status: Optional[str] = None
+    version: Optional[int] = None
+
+    class Config:
+        # Stored products hold internal fields, e.g. the component prices their price is based on.
+        extra = Extra.ignore
 
 class ProductRequestModel(ProductModel):
     key: str = Field(alias="productId")
    
-   
\ No newline at end of file
+class ProductPatchModel(CustomBaseModel):
+    owner_id: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    component_ids: Optional[list[str]] = None
+
+    @validator("*", pre=True)
+    def reject_null(cls, value):
+        if value is None:
+            raise ValueError("field may be omitted but not null")
+        return value
+
+class BatchItemResultModel(CustomBaseModel):
+    index: int
+    status_code: int
+    product: Optional[ProductResponseModel] = None
+    detail: Optional[str] = None
+
+class BatchResponseModel(CustomBaseModel):
+    results: list[BatchItemResultModel]
+
+class ProductLookupRequestModel(CustomBaseModel):
+    product_ids: list[str]
+
+class ProductLookupResponseModel(CustomBaseModel):
+    products: list[ProductResponseModel]
+    missing_ids: list[str]
+    forbidden_ids: list[str]
+
+class ComponentPriceChangeModel(CustomBaseModel):
+    price: float
+    previous_price: Optional[float] = None
+
+class ComponentPriceChangeResultModel(CustomBaseModel):
+    component_id: str
+    updated_product_ids: list[str]
+    failed_product_ids: list[str]
+
+class PricingStatusModel(CustomBaseModel):
+    product_id: str
+    pricing_status: str
+    attempts: Optional[int] = None
@@ -0,0 +1,173 @@
+from collections import OrderedDict, deque
+import asyncio
+import math
+import time
+
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, message:str, retry_after:float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    def __init__(self, rate:float, burst:float, now:float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def _refill(self, now:float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, cost:float, now:float) -> float:
+        # A cost above the burst waits for a full bucket and leaves the bucket in debt.
+        return self.refill_time(min(cost, self.burst), now)
+
+    def refill_time(self, tokens:float, now:float) -> float:
+        self._refill(now)
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self, cost:float, now:float):
+        self._refill(now)
+        self.tokens -= cost
+
+    def is_full(self, now:float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _UserQueue:
+    def __init__(self, bucket:TokenBucket = None):
+        self.bucket = bucket
+        self.waiters = deque()
+
+    def wait_time(self, cost:float, now:float) -> float:
+        return 0.0 if self.bucket is None else self.bucket.wait_time(cost, now)
+
+    def take(self, cost:float, now:float):
+        if self.bucket is not None:
+            self.bucket.take(cost, now)
+
+    def is_idle(self, now:float) -> bool:
+        return not self.waiters and (self.bucket is None or self.bucket.is_full(now))
+
+
+class AdmissionController:
+    # Every user has a token bucket and a queue of waiting calls. Free slots of the
+    # global concurrency limit go round-robin to the users whose next call has a token,
+    # so a single user cannot take all slots while others are waiting.
+    def __init__(
+        self,
+        rate:float = 10.0,
+        burst:float = 20.0,
+        max_concurrency:int = 16,
+        max_queued_per_user:int = 50,
+        timer = time.monotonic,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queued_per_user = max_queued_per_user
+        self._timer = timer
+        self._users = OrderedDict()
+        self._active = 0
+        self._dispatch_handle = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _user(self, user_id:str, now:float) -> _UserQueue:
+        user = self._users.get(user_id)
+        if user is None:
+            user = _UserQueue(TokenBucket(self.rate, self.burst, now) if self.rate > 0 else None)
+            self._users[user_id] = user
+            # Users are ordered by their last admission, new users have not been admitted yet.
+            self._users.move_to_end(user_id, last=False)
+        return user
+
+    def _retry_after(self, user:_UserQueue, cost:float, now:float) -> float:
+        if user.bucket is None:
+            return 1.0
+        queued_cost = sum(waiter_cost for _, waiter_cost in user.waiters)
+        return user.bucket.refill_time(queued_cost + cost, now)
+
+    async def acquire(self, user_id:str, cost:float = 1):
+        now = self._timer()
+        user = self._user(user_id, now)
+        if not user.waiters and self._active < self.max_concurrency and user.wait_time(cost, now) == 0:
+            user.take(cost, now)
+            self._active += 1
+            self.admitted += 1
+            self._users.move_to_end(user_id)
+            return
+        if len(user.waiters) >= self.max_queued_per_user:
+            self.rejected += 1
+            raise AdmissionRejectedError(f"Too many pricing requests of user '{user_id}'.", self._retry_after(user, cost, now))
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, cost)
+        user.waiters.append(waiter)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if waiter in user.waiters:
+                    user.waiters.remove(waiter)
+            else:
+                # The slot was granted before the cancellation arrived.
+                self.release()
+            raise
+
+    def release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = self._timer()
+        next_wait = None
+        while self._active < self.max_concurrency:
+            granted = False
+            for user_id, user in list(self._users.items()):
+                while user.waiters and user.waiters[0][0].cancelled():
+                    user.waiters.popleft()
+                if not user.waiters:
+                    if user.is_idle(now):
+                        del self._users[user_id]
+                    continue
+                future, cost = user.waiters[0]
+                wait = user.wait_time(cost, now)
+                if wait > 0:
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+                    continue
+                user.waiters.popleft()
+                user.take(cost, now)
+                self._active += 1
+                self.admitted += 1
+                future.set_result(None)
+                self._users.move_to_end(user_id)
+                granted = True
+                break
+            if not granted:
+                break
+        if self._dispatch_handle is not None:
+            self._dispatch_handle.cancel()
+            self._dispatch_handle = None
+        if next_wait is not None and self._active < self.max_concurrency:
+            self._dispatch_handle = asyncio.get_running_loop().call_later(next_wait, self._dispatch)
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": sum(len(user.waiters) for user in self._users.values()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
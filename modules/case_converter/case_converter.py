@@ -1,7 +1,12 @@
+from functools import lru_cache
+
 def snake_to_camel_case(string:str)->str:
     if not isinstance(string, str):
         raise ValueError("Argument must be a string")
+    return _snake_to_camel_case(string)
 
+@lru_cache(maxsize=None)
+def _snake_to_camel_case(string:str)->str:
     words = string.split("_")
     title_case = "".join(word.title() for word in words if word)
     camel_case = title_case[0].lower() + title_case[1:]
@@ -0,0 +1,101 @@
+from collections import deque
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_rate_threshold:float = 0.5,
+        minimum_calls:int = 10,
+        window_size:int = 20,
+        open_duration:float = 30.0,
+        half_open_max_calls:int = 1,
+        timer = time.monotonic,
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self._timer = timer
+        self._outcomes = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._move_to_half_open_if_due()
+            return self._state
+
+    def _move_to_half_open_if_due(self):
+        if self._state == OPEN and self._timer() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._timer()
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def before_call(self):
+        with self._lock:
+            self._move_to_half_open_if_due()
+            if self._state == OPEN or (self._state == HALF_OPEN and self._half_open_calls >= self.half_open_max_calls):
+                self.rejected_calls += 1
+                raise CircuitOpenError("Circuit breaker is open, the upstream service is not called.")
+            if self._state == HALF_OPEN:
+                self._half_open_calls += 1
+
+    def cancel_call(self):
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == OPEN:
+                return
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == OPEN:
+                return
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            if len(self._outcomes) >= self.minimum_calls and self.failure_rate() >= self.failure_rate_threshold:
+                self._open()
+
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "failure_rate": self.failure_rate(),
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected_calls,
+            }
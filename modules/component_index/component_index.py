@@ -0,0 +1,84 @@
+from collections import defaultdict
+from typing import Optional
+import threading
+import time
+
+
+class ComponentIndex:
+    def __init__(self, max_age:Optional[float] = None, timer = time.monotonic):
+        self._product_keys = defaultdict(set)
+        self._component_ids = {}
+        self._lock = threading.Lock()
+        self._changes_during_build = None
+        self._built_at = None
+        # Changes of other processes can get lost, so the index is rebuilt after max_age seconds.
+        self.max_age = max_age
+        self.timer = timer
+
+    @property
+    def is_built(self) -> bool:
+        built_at = self._built_at
+        return built_at is not None and (self.max_age is None or self.timer() - built_at < self.max_age)
+
+    def _add(self, product_key:str, component_ids:list[str]):
+        self._remove(product_key)
+        self._component_ids[product_key] = set(component_ids)
+        for component_id in self._component_ids[product_key]:
+            self._product_keys[component_id].add(product_key)
+
+    def _remove(self, product_key:str):
+        for component_id in self._component_ids.pop(product_key, ()):
+            self._product_keys[component_id].discard(product_key)
+            if not self._product_keys[component_id]:
+                del self._product_keys[component_id]
+
+    def add(self, product:dict):
+        with self._lock:
+            self._add(product["key"], product["component_ids"])
+            if self._changes_during_build is not None:
+                self._changes_during_build.append((product["key"], list(product["component_ids"])))
+
+    def merge(self, product:dict):
+        # Keeps the components already indexed for the product, for changes that may arrive out of order.
+        with self._lock:
+            component_ids = set(product["component_ids"]) | self._component_ids.get(product["key"], set())
+            self._add(product["key"], component_ids)
+            if self._changes_during_build is not None:
+                self._changes_during_build.append((product["key"], list(component_ids)))
+
+    def remove(self, product_key:str):
+        with self._lock:
+            self._remove(product_key)
+            if self._changes_during_build is not None:
+                self._changes_during_build.append((product_key, None))
+
+    def product_keys(self, component_id:str) -> set[str]:
+        with self._lock:
+            return set(self._product_keys.get(component_id, ()))
+
+    def start_build(self):
+        with self._lock:
+            self._changes_during_build = []
+
+    def finish_build(self, products):
+        # Writes that happened while the products were scanned are replayed on top
+        # of the scan, so they win over the possibly older scanned versions.
+        with self._lock:
+            self._product_keys = defaultdict(set)
+            self._component_ids = {}
+            for product in products:
+                self._add(product["key"], product["component_ids"])
+            for product_key, component_ids in self._changes_during_build or ():
+                if component_ids is None:
+                    self._remove(product_key)
+                else:
+                    self._add(product_key, component_ids)
+            self._changes_during_build = None
+            self._built_at = self.timer()
+
+    def invalidate(self):
+        with self._lock:
+            self._product_keys = defaultdict(set)
+            self._component_ids = {}
+            self._changes_during_build = None
+            self._built_at = None
@@ -0,0 +1,240 @@
+from modules.storage.storage import FetchResponse, ProductStorage
+import modules.request_timing.request_timing as request_timing
+from bisect import bisect_left
+from typing import Callable, Optional
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+STORAGE_TIMING_STAGES = {
+    "get": "db-get",
+    "fetch": "db-get",
+    "insert": "db-write",
+    "put": "db-write",
+    "update": "db-write",
+    "delete": "db-write",
+    "put_many": "db-write",
+    "put_if": "db-write",
+    "update_if": "db-write",
+    "delete_if": "db-write",
+}
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames:tuple, labelvalues:tuple, extra:str = None) -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra is not None:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value:float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> list[str]:
+        return []
+
+    def render(self) -> list[str]:
+        return self._header() + self.samples()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount:float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple = (), buckets:tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value:float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Bucket counts are kept per bucket and only summed up when rendered.
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labelvalues) -> int:
+        series = self._series.get(labelvalues)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        lines = []
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    def __init__(self, name:str, documentation:str, type:str, labelnames:tuple, collect:Callable[[], dict]):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self._collect = collect
+
+    def samples(self) -> list[str]:
+        values = self._collect()
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric:Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name:str, documentation:str, labelnames:tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name:str, documentation:str, labelnames:tuple = (), buckets:tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name:str, documentation:str, type:str, labelnames:tuple, collect:Callable[[], dict]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, type, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedStorage(ProductStorage):
+    def __init__(self, storage:ProductStorage, duration:Histogram, errors:Counter):
+        self.storage = storage
+        self.duration = duration
+        self.errors = errors
+
+    def _call(self, operation:str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            self.errors.inc(operation)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.duration.observe(duration, operation)
+            request_timing.record(STORAGE_TIMING_STAGES[operation], duration)
+
+    def get(self, key:str) -> Optional[dict]:
+        return self._call("get", self.storage.get, key)
+
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        return self._call("fetch", self.storage.fetch, query, limit=limit, last=last)
+
+    def insert(self, item:dict) -> dict:
+        return self._call("insert", self.storage.insert, item)
+
+    def put(self, item:dict) -> dict:
+        return self._call("put", self.storage.put, item)
+
+    def update(self, updates:dict, key:str):
+        self._call("update", self.storage.update, updates, key)
+
+    def delete(self, key:str):
+        self._call("delete", self.storage.delete, key)
+
+    def put_many(self, items:list[dict]) -> dict:
+        return self._call("put_many", self.storage.put_many, items)
+
+    def put_if(self, item:dict, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        return self._call("put_if", self.storage.put_if, item, conditions, current_item)
+
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        return self._call("update_if", self.storage.update_if, updates, key, conditions, current_item)
+
+    def delete_if(self, key:str, conditions:dict) -> dict:
+        return self._call("delete_if", self.storage.delete_if, key, conditions)
+
+    def close(self):
+        self.storage.close()
+
+
+class MetricsMiddleware:
+    def __init__(self, app, duration:Histogram, requests:Counter):
+        self.app = app
+        self.duration = duration
+        self.requests = requests
+        self._route_paths = None
+
+    def _route_path(self, scope:dict) -> str:
+        # The router stores the matched endpoint in the scope, its path template keeps the label cardinality low.
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {getattr(route, "endpoint", None): route.path for route in scope["router"].routes}
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            labels = (scope["method"], self._route_path(scope), str(status_code))
+            self.duration.observe(time.perf_counter() - start, *labels)
+            self.requests.inc(*labels)
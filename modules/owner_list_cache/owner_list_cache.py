@@ -0,0 +1,44 @@
+from modules.ttl_cache.ttl_cache import TTLCache
+from typing import Optional
+import hashlib
+import threading
+
+
+class OwnerListCache:
+    def __init__(self, max_size:int = 1024, ttl:float = 30.0):
+        self._bodies = TTLCache(max_size=max_size, ttl=ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, owner_id:str) -> int:
+        return self._versions.get(owner_id, 0)
+
+    def bump(self, owner_id:str):
+        with self._lock:
+            self._versions[owner_id] = self._versions.get(owner_id, 0) + 1
+        self._bodies.delete(owner_id)
+
+    def get(self, owner_id:str) -> Optional[tuple[bytes, str]]:
+        entry = self._bodies.get(owner_id)
+        if entry is None:
+            return None
+        version, body, etag = entry
+        if version != self.version(owner_id):
+            return None
+        return body, etag
+
+    def set(self, owner_id:str, version:int, body:bytes) -> str:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if version == self.version(owner_id):
+            self._bodies.set(owner_id, (version, body, etag))
+        return etag
+
+    def stats(self) -> dict:
+        return self._bodies.stats()
+
+
+def etag_matches(if_none_match:Optional[str], etag:str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
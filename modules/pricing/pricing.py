@@ -0,0 +1,290 @@
+from modules.circuit_breaker.circuit_breaker import CircuitBreaker, CircuitOpenError
+from modules.ttl_cache.ttl_cache import TTLCache
+from collections import Counter
+from typing import TYPE_CHECKING, Callable, NamedTuple, Optional
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class ComponentPriceNotFoundError(LookupError):
+    pass
+
+
+class PriceLookup(NamedTuple):
+    prices: dict
+    stale_ids: set
+
+
+class PriceQuote(NamedTuple):
+    price: float
+    is_stale: bool
+    # Price of every component the quote is based on, as far as it is known.
+    component_prices: Optional[dict] = None
+
+
+def is_upstream_failure(error:BaseException) -> bool:
+    import httpx
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, CircuitOpenError, asyncio.TimeoutError))
+
+
+def upstream_error_type(error:BaseException) -> str:
+    import httpx
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transport"
+    return "other"
+
+
+def sum_component_prices(component_ids:list[str], prices:dict[str, float]) -> float:
+    component_counts = Counter(component_ids)
+    return sum(prices[component_id] * count for component_id, count in component_counts.items())
+
+
+class ComponentPriceClient:
+    def __init__(
+        self,
+        base_url:str,
+        timeout:float = 5.0,
+        max_concurrency:int = 10,
+        cache:TTLCache = None,
+        bulk_price_path:str = None,
+        bulk_max_ids:int = 100,
+        circuit_breaker:CircuitBreaker = None,
+        timeout_budget:float = None,
+        transport:"httpx.AsyncBaseTransport" = None,
+        observe_request:Callable[[str, float, Optional[BaseException]], None] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.bulk_price_path = bulk_price_path
+        self.bulk_max_ids = bulk_max_ids
+        self.circuit_breaker = circuit_breaker
+        self.timeout_budget = timeout_budget
+        self._transport = transport
+        self.observe_request = observe_request
+        self._client = None
+        self._semaphore = None
+        self._in_flight = {}
+        self._loop = None
+
+    def _bind_to_running_loop(self):
+        # The pool and the semaphore belong to the event loop they were created on,
+        # so they are rebuilt when the client is used from a different loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._discard_client()
+            # httpx is imported on first use, it is a large part of the import time of the service.
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self._transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._in_flight = {}
+            self._loop = loop
+
+    def _discard_client(self):
+        # The previous client can only be closed on its own loop. If that loop has stopped,
+        # its connections cannot be used anymore and are dropped with the client.
+        client, loop = self._client, self._loop
+        self._client = None
+        if client is not None and loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    async def _request(self, operation:str, method:str, url:str, **kwargs) -> "httpx.Response":
+        if self.observe_request is None:
+            return await self._send_request(method, url, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = await self._send_request(method, url, **kwargs)
+        except Exception as error:
+            self.observe_request(operation, time.perf_counter() - start, error)
+            raise
+        self.observe_request(operation, time.perf_counter() - start, None)
+        return response
+
+    async def _send_request(self, method:str, url:str, **kwargs) -> "httpx.Response":
+        self._bind_to_running_loop()
+        if self.circuit_breaker is None:
+            async with self._semaphore:
+                response = await self._client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response
+
+        self.circuit_breaker.before_call()
+        try:
+            async with self._semaphore:
+                response = await self._client.request(method, url, **kwargs)
+            response.raise_for_status()
+        except asyncio.CancelledError:
+            self.circuit_breaker.cancel_call()
+            raise
+        except Exception as error:
+            if is_upstream_failure(error):
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            raise
+        self.circuit_breaker.record_success()
+        return response
+
+    async def fetch_price(self, component_id:str) -> float:
+        response = await self._request("price", "GET", f"/components/{component_id}/price")
+        return response.json()["price"]
+
+    async def fetch_prices(self, component_ids:list[str]) -> dict[str, float]:
+        response = await self._request("bulk_price", "POST", self.bulk_price_path, json={"componentIds": component_ids})
+        return {component["componentId"]: component["price"] for component in response.json()}
+
+    async def _fetch_and_cache_price(self, component_id:str) -> float:
+        price = await self.fetch_price(component_id)
+        if self.cache is not None:
+            self.cache.set(component_id, price)
+        return price
+
+    async def _fetch_and_cache_prices(self, component_ids:list[str]) -> dict[str, float]:
+        prices = await self.fetch_prices(component_ids)
+        if self.cache is not None:
+            for component_id, price in prices.items():
+                self.cache.set(component_id, price)
+        return prices
+
+    async def _price_from_bulk_fetch(self, bulk_fetch:asyncio.Future, component_id:str) -> float:
+        prices = await bulk_fetch
+        if component_id not in prices:
+            raise ComponentPriceNotFoundError(f"Price of component {component_id} not found.")
+        return prices[component_id]
+
+    def _track_in_flight(self, component_id:str, fetch):
+        fetch = asyncio.ensure_future(fetch)
+        self._in_flight[component_id] = fetch
+        fetch.add_done_callback(lambda done: self._forget_in_flight(component_id, done))
+
+    def _get_cached_price(self, component_id:str):
+        if self.cache is None:
+            return None
+        return self.cache.get(component_id)
+
+    def _get_stale_price(self, component_id:str):
+        if self.cache is None:
+            return None
+        return self.cache.peek(component_id)
+
+    async def get_price(self, component_id:str) -> float:
+        prices = await self.get_prices([component_id])
+        return prices[component_id]
+
+    async def get_prices(self, component_ids:list[str], return_exceptions:bool = False) -> dict[str, float]:
+        lookup = await self.lookup_prices(component_ids, return_exceptions=return_exceptions)
+        return lookup.prices
+
+    async def lookup_prices(self, component_ids:list[str], return_exceptions:bool = False) -> PriceLookup:
+        prices = {}
+        stale_ids = set()
+        missing_ids = []
+        for component_id in dict.fromkeys(component_ids):
+            price = self._get_cached_price(component_id)
+            if price is None:
+                missing_ids.append(component_id)
+            else:
+                prices[component_id] = price
+        if not missing_ids:
+            return PriceLookup(prices, stale_ids)
+
+        self._bind_to_running_loop()
+        # Concurrent misses for the same component share a single upstream request.
+        ids_to_fetch = [component_id for component_id in missing_ids if component_id not in self._in_flight]
+        if self.bulk_price_path is None:
+            for component_id in ids_to_fetch:
+                self._track_in_flight(component_id, self._fetch_and_cache_price(component_id))
+        else:
+            for start in range(0, len(ids_to_fetch), self.bulk_max_ids):
+                chunk = ids_to_fetch[start:start + self.bulk_max_ids]
+                bulk_fetch = asyncio.ensure_future(self._fetch_and_cache_prices(chunk))
+                for component_id in chunk:
+                    self._track_in_flight(component_id, self._price_from_bulk_fetch(bulk_fetch, component_id))
+        fetches = [self._in_flight[component_id] for component_id in missing_ids]
+        # Fetches still running when the budget is used up keep filling the cache in the background.
+        await asyncio.wait(fetches, timeout=self.timeout_budget)
+
+        for component_id, fetch in zip(missing_ids, fetches):
+            if not fetch.done() or fetch.cancelled():
+                error = asyncio.TimeoutError(f"Price of component {component_id} was not received in time.")
+            else:
+                error = fetch.exception()
+            if error is None:
+                prices[component_id] = fetch.result()
+                continue
+            stale_price = self._get_stale_price(component_id) if is_upstream_failure(error) else None
+            if stale_price is not None:
+                prices[component_id] = stale_price
+                stale_ids.add(component_id)
+            elif return_exceptions:
+                prices[component_id] = error
+            else:
+                raise error
+        return PriceLookup(prices, stale_ids)
+
+    def _forget_in_flight(self, component_id:str, fetch:asyncio.Future):
+        if self._in_flight.get(component_id) is fetch:
+            del self._in_flight[component_id]
+        if not fetch.cancelled():
+            fetch.exception()
+
+    async def calculate_price(self, component_ids:list[str]) -> float:
+        quote = await self.quote_price(component_ids)
+        return quote.price
+
+    async def quote_price(self, component_ids:list[str]) -> PriceQuote:
+        lookup = await self.lookup_prices(component_ids)
+        return PriceQuote(sum_component_prices(component_ids, lookup.prices), bool(lookup.stale_ids), dict(lookup.prices))
+
+    async def quote_price_change(
+        self,
+        previous_component_ids:list[str],
+        previous_price:float,
+        component_ids:list[str],
+        previous_component_prices:dict[str, float] = None,
+    ) -> PriceQuote:
+        # Only added and removed components are priced, the stored price is assumed to match the current component prices.
+        # Removed components are subtracted with the price they were added with, if it is known.
+        previous_component_prices = previous_component_prices or {}
+        previous_counts = Counter(previous_component_ids)
+        counts = Counter(component_ids)
+        added_counts = counts - previous_counts
+        removed_counts = previous_counts - counts
+        lookup = await self.lookup_prices(list(added_counts) + [component_id for component_id in removed_counts if component_id not in previous_component_prices])
+        removed_prices = {**lookup.prices, **previous_component_prices}
+        price = (
+            previous_price
+            + sum(lookup.prices[component_id] * count for component_id, count in added_counts.items())
+            - sum(removed_prices[component_id] * count for component_id, count in removed_counts.items())
+        )
+        component_prices = {component_id: component_price for component_id, component_price in previous_component_prices.items() if component_id in counts}
+        component_prices.update((component_id, lookup.prices[component_id]) for component_id in added_counts)
+        return PriceQuote(price, bool(lookup.stale_ids), component_prices)
+
+    async def aclose(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+        self._in_flight = {}
+        self._loop = None
@@ -0,0 +1,101 @@
+from modules.ttl_cache.ttl_cache import TTLCache
+from typing import Awaitable, Callable, Optional
+import asyncio
+import random
+
+
+class PricingQueueFullError(Exception):
+    pass
+
+
+class PricingQueue:
+    def __init__(
+        self,
+        price_product:Callable[[str], Awaitable[None]],
+        mark_failed:Callable[[str], Awaitable[None]],
+        workers:int = 4,
+        max_size:int = 1000,
+        max_attempts:int = 5,
+        retry_base_delay:float = 0.5,
+        retry_max_delay:float = 30.0,
+    ):
+        self.price_product = price_product
+        self.mark_failed = mark_failed
+        self.workers = workers
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._jobs = TTLCache(max_size=max(max_size * 10, 1000), ttl=3600.0)
+        self._queue = None
+        self._worker_tasks = []
+        self._loop = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._worker_tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+            self._loop = loop
+
+    async def start(self):
+        self._ensure_started()
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def submit(self, product_key:str):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(product_key)
+        except asyncio.QueueFull:
+            raise PricingQueueFullError("Pricing queue is full.")
+        self._jobs.set(product_key, {"state": "queued", "attempts": 0})
+
+    def status(self, product_key:str) -> Optional[dict]:
+        return self._jobs.peek(product_key)
+
+    def retry_delay(self, attempt:int) -> float:
+        delay = min(self.retry_base_delay * 2 ** (attempt - 1), self.retry_max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _work(self):
+        while True:
+            product_key = await self._queue.get()
+            try:
+                await self._run_job(product_key)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, product_key:str):
+        for attempt in range(1, self.max_attempts + 1):
+            self._jobs.set(product_key, {"state": "running", "attempts": attempt})
+            try:
+                await self.price_product(product_key)
+                self._jobs.set(product_key, {"state": "done", "attempts": attempt})
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if attempt < self.max_attempts:
+                    self._jobs.set(product_key, {"state": "retrying", "attempts": attempt})
+                    await asyncio.sleep(self.retry_delay(attempt))
+        self._jobs.set(product_key, {"state": "failed", "attempts": self.max_attempts})
+        try:
+            await self.mark_failed(product_key)
+        except Exception:
+            pass
+
+    async def stop(self, drain_timeout:float = 10.0):
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for worker_task in self._worker_tasks:
+            worker_task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+        self._loop = None
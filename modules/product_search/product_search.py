@@ -0,0 +1,219 @@
+from modules.ttl_cache.ttl_cache import TTLCache
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import islice
+from typing import NamedTuple, Optional
+import threading
+
+
+class ProductQuery(NamedTuple):
+    name_prefix: Optional[str] = None
+    name_contains: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    component_id: Optional[str] = None
+    sort: Optional[str] = None
+    limit: Optional[int] = None
+
+
+class SearchResult(NamedTuple):
+    products: list[dict]
+    total: int
+
+
+def trigrams(text:str) -> set[str]:
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+def _insert_sorted(values:list, keys:list[str], value, key:str):
+    index = bisect_right(values, value)
+    values.insert(index, value)
+    keys.insert(index, key)
+
+
+def _remove_sorted(values:list, keys:list[str], value, key:str):
+    index = bisect_left(values, value)
+    while keys[index] != key:
+        index += 1
+    del values[index]
+    del keys[index]
+
+
+class OwnerProducts:
+    def __init__(self, products:list[dict] = ()):
+        self.products = {}
+        self._price_values = []
+        self._price_keys = []
+        self._name_values = []
+        self._name_keys = []
+        self._trigram_keys = defaultdict(set)
+        self._component_keys = defaultdict(set)
+        for product in products:
+            self.products[product["key"]] = product
+        # The sorted arrays are built once instead of inserting every product.
+        priced = sorted((product["price"], key) for key, product in self.products.items() if product.get("price") is not None)
+        self._price_values = [price for price, _ in priced]
+        self._price_keys = [key for _, key in priced]
+        named = sorted((product["name"].lower(), key) for key, product in self.products.items())
+        self._name_values = [name for name, _ in named]
+        self._name_keys = [key for _, key in named]
+        for key, product in self.products.items():
+            self._add_to_inverted_indexes(key, product)
+
+    def __len__(self):
+        return len(self.products)
+
+    def _add_to_inverted_indexes(self, key:str, product:dict):
+        for trigram in trigrams(product["name"].lower()):
+            self._trigram_keys[trigram].add(key)
+        for component_id in product["component_ids"]:
+            self._component_keys[component_id].add(key)
+
+    def add(self, product:dict):
+        key = product["key"]
+        indexed_product = self.products.get(key)
+        if indexed_product is not None and (indexed_product.get("version") or 0) > (product.get("version") or 0):
+            return
+        self.remove(key)
+        self.products[key] = product
+        if product.get("price") is not None:
+            _insert_sorted(self._price_values, self._price_keys, product["price"], key)
+        _insert_sorted(self._name_values, self._name_keys, product["name"].lower(), key)
+        self._add_to_inverted_indexes(key, product)
+
+    def remove(self, key:str):
+        product = self.products.pop(key, None)
+        if product is None:
+            return
+        if product.get("price") is not None:
+            _remove_sorted(self._price_values, self._price_keys, product["price"], key)
+        name = product["name"].lower()
+        _remove_sorted(self._name_values, self._name_keys, name, key)
+        for index, values in ((self._trigram_keys, trigrams(name)), (self._component_keys, product["component_ids"])):
+            for value in values:
+                index[value].discard(key)
+                if not index[value]:
+                    del index[value]
+
+    def _price_range_keys(self, min_price:Optional[float], max_price:Optional[float]) -> set[str]:
+        start = 0 if min_price is None else bisect_left(self._price_values, min_price)
+        end = len(self._price_values) if max_price is None else bisect_right(self._price_values, max_price)
+        return set(self._price_keys[start:end])
+
+    def _name_prefix_keys(self, prefix:str) -> set[str]:
+        keys = set()
+        for index in range(bisect_left(self._name_values, prefix), len(self._name_values)):
+            if not self._name_values[index].startswith(prefix):
+                break
+            keys.add(self._name_keys[index])
+        return keys
+
+    def _name_substring_keys(self, text:str) -> set[str]:
+        if len(text) < 3:
+            return {key for name, key in zip(self._name_values, self._name_keys) if text in name}
+        # Trigrams only narrow down the candidates, the names are compared afterwards.
+        trigram_keys = sorted((self._trigram_keys.get(trigram, set()) for trigram in trigrams(text)), key=len)
+        candidates = trigram_keys[0].intersection(*trigram_keys[1:])
+        return {key for key in candidates if text in self.products[key]["name"].lower()}
+
+    def _ordered_keys(self, sort:Optional[str]) -> list[str]:
+        if sort in ("price", "-price"):
+            priced_keys = self._price_keys if sort == "price" else self._price_keys[::-1]
+            # Products without a price come last in both directions.
+            return priced_keys + sorted(key for key, product in self.products.items() if product.get("price") is None)
+        if sort == "name":
+            return self._name_keys
+        if sort == "-name":
+            return self._name_keys[::-1]
+        return sorted(self.products)
+
+    def search(self, query:ProductQuery) -> SearchResult:
+        key_sets = []
+        if query.component_id is not None:
+            key_sets.append(self._component_keys.get(query.component_id, set()))
+        if query.min_price is not None or query.max_price is not None:
+            key_sets.append(self._price_range_keys(query.min_price, query.max_price))
+        if query.name_prefix is not None:
+            key_sets.append(self._name_prefix_keys(query.name_prefix.lower()))
+        if query.name_contains is not None:
+            key_sets.append(self._name_substring_keys(query.name_contains.lower()))
+        if key_sets:
+            key_sets.sort(key=len)
+            matching_keys = key_sets[0].intersection(*key_sets[1:])
+            if query.sort is None:
+                keys = sorted(matching_keys)
+            else:
+                keys = (key for key in self._ordered_keys(query.sort) if key in matching_keys)
+            total = len(matching_keys)
+        else:
+            keys = self._ordered_keys(query.sort)
+            total = len(self.products)
+        return SearchResult([self.products[key] for key in islice(keys, query.limit)], total)
+
+
+class ProductSearchIndex:
+    def __init__(self, max_owners:int = 1000, ttl:float = 300.0):
+        self._owners = TTLCache(max_size=max_owners, ttl=ttl)
+        self._changes_during_load = {}
+        self._lock = threading.Lock()
+
+    def search(self, owner_id:str, query:ProductQuery) -> Optional[SearchResult]:
+        owner_products = self._owners.get(owner_id)
+        if owner_products is None:
+            return None
+        return self.search_products(owner_products, query)
+
+    def search_products(self, owner_products:OwnerProducts, query:ProductQuery) -> SearchResult:
+        with self._lock:
+            return owner_products.search(query)
+
+    def start_load(self, owner_id:str):
+        with self._lock:
+            self._changes_during_load.setdefault(owner_id, [])
+
+    def finish_load(self, owner_id:str, products:list[dict]) -> OwnerProducts:
+        # Writes that happened while the products were fetched are replayed on top of them.
+        owner_products = OwnerProducts(products)
+        with self._lock:
+            if owner_id not in self._changes_during_load:
+                # A concurrent load finished first and has been kept up to date since.
+                loaded_products = self._owners.peek(owner_id)
+                if loaded_products is not None:
+                    return loaded_products
+            for product_key, product in self._changes_during_load.pop(owner_id, ()):
+                if product is None:
+                    owner_products.remove(product_key)
+                else:
+                    owner_products.add(product)
+            self._owners.set(owner_id, owner_products)
+        return owner_products
+
+    def cancel_load(self, owner_id:str):
+        with self._lock:
+            self._changes_during_load.pop(owner_id, None)
+
+    def _apply(self, owner_id:str, product_key:str, product:Optional[dict]):
+        with self._lock:
+            owner_products = self._owners.peek(owner_id)
+            if owner_products is not None:
+                if product is None:
+                    owner_products.remove(product_key)
+                else:
+                    owner_products.add(product)
+            if owner_id in self._changes_during_load:
+                self._changes_during_load[owner_id].append((product_key, product))
+
+    def add(self, product:dict):
+        self._apply(product["owner_id"], product["key"], dict(product))
+
+    def remove(self, product:dict):
+        self._apply(product["owner_id"], product["key"], None)
+
+    def invalidate(self, owner_id:str = None):
+        if owner_id is None:
+            self._owners.clear()
+        else:
+            self._owners.delete(owner_id)
+
+    def stats(self) -> dict:
+        return self._owners.stats()
@@ -0,0 +1,151 @@
+from modules.ttl_cache.ttl_cache import TTLCache
+from fastapi.routing import APIRoute
+from contextvars import ContextVar
+from typing import Optional
+import asyncio
+import cProfile
+import hmac
+import io
+import pstats
+import threading
+import time
+import uuid
+
+PROFILE_STATS_LIMIT = 50
+
+_current_timings = ContextVar("request_timings", default=None)
+
+
+class ServerTimings:
+    def __init__(self):
+        self.durations = {}
+        self.endpoint_returned_at = None
+        self._lock = threading.Lock()
+
+    def add(self, name:str, duration:float):
+        # Storage calls of one request may run in parallel threads of the threadpool.
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def header(self, total:float) -> str:
+        entries = [f"{name};dur={duration * 1000:.2f}" for name, duration in self.durations.items()]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def is_valid_debug_token(token:Optional[str], expected_token:Optional[str]) -> bool:
+    return expected_token is not None and token is not None and hmac.compare_digest(token, expected_token)
+
+
+def record(name:str, duration:float):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, duration)
+
+
+class timed:
+    def __init__(self, name:str):
+        self.name = name
+        self._timings = None
+
+    def __enter__(self):
+        self._timings = _current_timings.get()
+        if self._timings is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timings is not None:
+            self._timings.add(self.name, time.perf_counter() - self._start)
+
+
+class TimedRoute(APIRoute):
+    # Time spent between the endpoint returning and the response being built is the
+    # response model validation and serialization done by FastAPI.
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        endpoint = self.dependant.call
+
+        if asyncio.iscoroutinefunction(endpoint):
+            async def timed_endpoint(*args, **kwargs):
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    mark_endpoint_returned()
+        else:
+            def timed_endpoint(*args, **kwargs):
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    mark_endpoint_returned()
+        self.dependant.call = timed_endpoint
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = _current_timings.get()
+            if timings is not None and timings.endpoint_returned_at is not None:
+                timings.add("serialize", time.perf_counter() - timings.endpoint_returned_at)
+            return response
+        return timed_handler
+
+
+def mark_endpoint_returned():
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.endpoint_returned_at = time.perf_counter()
+
+
+def format_profile(profile:cProfile.Profile) -> str:
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_STATS_LIMIT)
+    return output.getvalue()
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app, enabled:bool = False, token:str = None, profiles:TTLCache = None):
+        self.app = app
+        self.enabled = enabled
+        self.token = token
+        self.profiles = profiles
+        self._profiling = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.enabled or self.token is not None):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        token = headers.get(b"x-debug-token")
+        authorized = is_valid_debug_token(token.decode("latin-1") if token is not None else None, self.token)
+        if not (self.enabled or authorized):
+            await self.app(scope, receive, send)
+            return
+
+        # Profiles may contain sensitive data, so they always require the debug token.
+        # Only one profiler can be active per interpreter, concurrent requests are not profiled.
+        wants_profile = authorized and self.profiles is not None and b"x-debug-profile" in headers
+        profile = cProfile.Profile() if wants_profile and self._profiling.acquire(blocking=False) else None
+        profile_id = str(uuid.uuid4()) if profile is not None else None
+        timings = ServerTimings()
+        context_token = _current_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start":
+                response_headers = list(message.get("headers", []))
+                response_headers.append((b"server-timing", timings.header(time.perf_counter() - start).encode("latin-1")))
+                if profile_id is not None:
+                    response_headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message = {**message, "headers": response_headers}
+            await send(message)
+
+        if profile is not None:
+            profile.enable()
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling.release()
+                self.profiles.set(profile_id, format_profile(profile))
+            _current_timings.reset(context_token)
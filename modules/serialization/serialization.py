@@ -0,0 +1,31 @@
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from functools import lru_cache
+from typing import Any
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content:Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content:Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def field_aliases(model:type[BaseModel]) -> dict[str, str]:
+    return {field.name: field.alias for field in model.__fields__.values()}
+
+
+def to_aliases(item:dict, aliases:dict[str, str]) -> dict:
+    # Fields unknown to the model are dropped, like the response model would do.
+    return {aliases[field]: value for field, value in item.items() if field in aliases}
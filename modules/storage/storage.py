@@ -0,0 +1,469 @@
+from abc import ABC, abstractmethod
+from modules.ttl_cache.ttl_cache import TTLCache
+from typing import Callable, Optional
+import json
+import os
+import sqlite3
+import threading
+import weakref
+
+STORAGE_BACKENDS = ("deta", "sqlite", "memory")
+PUT_MANY_LIMIT = 25
+
+
+class StorageError(Exception):
+    pass
+
+
+class ItemNotFoundError(StorageError):
+    pass
+
+
+class ItemExistsError(StorageError):
+    pass
+
+
+class ConditionFailedError(StorageError):
+    def __init__(self, message:str, item:Optional[dict] = None):
+        super().__init__(message)
+        self.item = item
+
+
+class FetchResponse:
+    def __init__(self, items:list[dict], last:Optional[str] = None):
+        self.items = items
+        self.count = len(items)
+        self.last = last
+
+
+class ProductStorage(ABC):
+    @abstractmethod
+    def get(self, key:str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        pass
+
+    @abstractmethod
+    def insert(self, item:dict) -> dict:
+        pass
+
+    @abstractmethod
+    def put(self, item:dict) -> dict:
+        pass
+
+    @abstractmethod
+    def update(self, updates:dict, key:str):
+        pass
+
+    @abstractmethod
+    def delete(self, key:str):
+        pass
+
+    @abstractmethod
+    def put_many(self, items:list[dict]) -> dict:
+        pass
+
+    # current_item is the item the caller has just read, backends may check the conditions against it instead of reading again.
+    @abstractmethod
+    def put_if(self, item:dict, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        pass
+
+    @abstractmethod
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        pass
+
+    @abstractmethod
+    def delete_if(self, key:str, conditions:dict) -> dict:
+        pass
+
+    def close(self):
+        pass
+
+
+def _check_put_many_size(items:list[dict]):
+    if len(items) > PUT_MANY_LIMIT:
+        raise StorageError(f"put_many accepts at most {PUT_MANY_LIMIT} items.")
+
+
+def _matches(item:dict, query:Optional[dict]) -> bool:
+    return not query or all(item.get(field) == value for field, value in query.items())
+
+
+def _check_conditions(key:str, item:Optional[dict], conditions:dict) -> dict:
+    if item is None or not _matches(item, conditions):
+        raise ConditionFailedError(f"Conditions for key '{key}' are not met", item)
+    return item
+
+
+class DetaStorage(ProductStorage):
+    def __init__(self, project_key:str, base_name:str, base = None):
+        if base is None:
+            if not project_key:
+                raise ValueError("The deta storage backend requires a PROJECT_KEY.")
+            from deta import Deta
+            base = Deta(project_key).Base(base_name)
+        self._base = base
+        # Deta Base has no conditional writes, so they are only atomic within this process.
+        self._key_locks = weakref.WeakValueDictionary()
+        self._key_locks_lock = threading.Lock()
+        # Items written by this process, an item read before one of these writes is outdated.
+        self._written_items = TTLCache(max_size=10000, ttl=300.0)
+
+    def _key_lock(self, key:str) -> threading.Lock:
+        with self._key_locks_lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._key_locks[key] = lock
+            return lock
+
+    def _current_item(self, key:str, current_item:Optional[dict]) -> Optional[dict]:
+        written_item = self._written_items.peek(key)
+        if current_item is None or (written_item is not None and written_item != current_item):
+            return self._base.get(key)
+        return current_item
+
+    def get(self, key:str) -> Optional[dict]:
+        return self._base.get(key)
+
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        return self._base.fetch(query, limit=limit, last=last)
+
+    def insert(self, item:dict) -> dict:
+        try:
+            inserted_item = self._base.insert(item)
+        except Exception as error:
+            # The Deta SDK raises plain exceptions, a conflict is told apart by its message.
+            if "already exists" in str(error):
+                raise ItemExistsError(str(error))
+            raise
+        self._written_items.set(item["key"], dict(item))
+        return inserted_item
+
+    def put(self, item:dict) -> dict:
+        put_item = self._base.put(item)
+        self._written_items.set(item["key"], dict(item))
+        return put_item
+
+    def update(self, updates:dict, key:str):
+        try:
+            self._base.update(updates, key)
+        except Exception as error:
+            if "not found" in str(error):
+                raise ItemNotFoundError(str(error))
+            raise
+        self._written_items.set(key, {"key": key})
+
+    def delete(self, key:str):
+        self._base.delete(key)
+        self._written_items.set(key, {"key": key})
+
+    def put_many(self, items:list[dict]) -> dict:
+        _check_put_many_size(items)
+        result = self._base.put_many(items)
+        for item in items:
+            self._written_items.set(item["key"], dict(item))
+        return result
+
+    def put_if(self, item:dict, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        with self._key_lock(item["key"]):
+            previous_item = _check_conditions(item["key"], self._current_item(item["key"], current_item), conditions)
+            self._base.put(item)
+            self._written_items.set(item["key"], dict(item))
+        return previous_item
+
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        with self._key_lock(key):
+            previous_item = _check_conditions(key, self._current_item(key, current_item), conditions)
+            self._base.update(updates, key)
+            self._written_items.set(key, {**previous_item, **updates})
+        return previous_item
+
+    def delete_if(self, key:str, conditions:dict) -> dict:
+        with self._key_lock(key):
+            previous_item = _check_conditions(key, self._current_item(key, None), conditions)
+            self._base.delete(key)
+            self._written_items.set(key, {"key": key})
+        return previous_item
+
+
+class MemoryStorage(ProductStorage):
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key:str) -> Optional[dict]:
+        with self._lock:
+            item = self._items.get(key)
+            return json.loads(item) if item is not None else None
+
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        with self._lock:
+            keys = sorted(key for key in self._items if last is None or key > last)
+            items = []
+            for key in keys:
+                item = json.loads(self._items[key])
+                if _matches(item, query):
+                    if len(items) == limit:
+                        return FetchResponse(items, last=items[-1]["key"])
+                    items.append(item)
+            return FetchResponse(items)
+
+    def insert(self, item:dict) -> dict:
+        with self._lock:
+            if item["key"] in self._items:
+                raise ItemExistsError(f"Item with key '{item['key']}' already exists")
+            self._items[item["key"]] = json.dumps(item)
+        return item
+
+    def put(self, item:dict) -> dict:
+        with self._lock:
+            self._items[item["key"]] = json.dumps(item)
+        return item
+
+    def update(self, updates:dict, key:str):
+        with self._lock:
+            if key not in self._items:
+                raise ItemNotFoundError(f"Key '{key}' not found")
+            item = json.loads(self._items[key])
+            item.update(updates)
+            self._items[key] = json.dumps(item)
+
+    def delete(self, key:str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def put_many(self, items:list[dict]) -> dict:
+        _check_put_many_size(items)
+        with self._lock:
+            for item in items:
+                self._items[item["key"]] = json.dumps(item)
+        return {"processed": {"items": items}}
+
+    def _get_checked(self, key:str, conditions:dict) -> dict:
+        item = self._items.get(key)
+        return _check_conditions(key, json.loads(item) if item is not None else None, conditions)
+
+    def put_if(self, item:dict, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        with self._lock:
+            previous_item = self._get_checked(item["key"], conditions)
+            self._items[item["key"]] = json.dumps(item)
+        return previous_item
+
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        with self._lock:
+            previous_item = self._get_checked(key, conditions)
+            self._items[key] = json.dumps({**previous_item, **updates})
+        return previous_item
+
+    def delete_if(self, key:str, conditions:dict) -> dict:
+        with self._lock:
+            previous_item = self._get_checked(key, conditions)
+            del self._items[key]
+        return previous_item
+
+
+class SQLiteStorage(ProductStorage):
+    def __init__(self, path:str, table:str):
+        if not table.isidentifier():
+            raise ValueError("Table name must be a valid identifier.")
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, owner_id TEXT, data TEXT NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_owner_id ON {table} (owner_id, key)")
+
+    def _where(self, query:Optional[dict], last:Optional[str]) -> tuple[str, list]:
+        conditions = []
+        parameters = []
+        for field, value in (query or {}).items():
+            if field in ("key", "owner_id"):
+                conditions.append(f"{field} = ?")
+                parameters.append(value)
+            else:
+                conditions.append("json_extract(data, ?) = ?")
+                parameters.extend([f"$.{field}", value if isinstance(value, (str, int, float)) else json.dumps(value)])
+        if last is not None:
+            conditions.append("key > ?")
+            parameters.append(last)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def get(self, key:str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(f"SELECT data FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        where, parameters = self._where(query, last)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT data FROM {self.table}{where} ORDER BY key LIMIT ?",
+                (*parameters, limit + 1),
+            ).fetchall()
+        items = [json.loads(row[0]) for row in rows[:limit]]
+        return FetchResponse(items, last=items[-1]["key"] if len(rows) > limit else None)
+
+    def insert(self, item:dict) -> dict:
+        try:
+            with self._lock:
+                self._connection.execute(
+                    f"INSERT INTO {self.table} (key, owner_id, data) VALUES (?, ?, ?)",
+                    (item["key"], item.get("owner_id"), json.dumps(item)),
+                )
+        except sqlite3.IntegrityError:
+            raise ItemExistsError(f"Item with key '{item['key']}' already exists")
+        return item
+
+    def put(self, item:dict) -> dict:
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, owner_id, data) VALUES (?, ?, ?)",
+                (item["key"], item.get("owner_id"), json.dumps(item)),
+            )
+        return item
+
+    def update(self, updates:dict, key:str):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(f"SELECT data FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    raise ItemNotFoundError(f"Key '{key}' not found")
+                item = json.loads(row[0])
+                item.update(updates)
+                self._connection.execute(
+                    f"UPDATE {self.table} SET owner_id = ?, data = ? WHERE key = ?",
+                    (item.get("owner_id"), json.dumps(item), key),
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def delete(self, key:str):
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def put_many(self, items:list[dict]) -> dict:
+        _check_put_many_size(items)
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, owner_id, data) VALUES (?, ?, ?)",
+                    [(item["key"], item.get("owner_id"), json.dumps(item)) for item in items],
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return {"processed": {"items": items}}
+
+    def _write_if(self, key:str, conditions:dict, write) -> dict:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(f"SELECT data FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                previous_item = _check_conditions(key, json.loads(row[0]) if row is not None else None, conditions)
+                write(previous_item)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return previous_item
+
+    def _replace(self, item:dict):
+        self._connection.execute(
+            f"UPDATE {self.table} SET owner_id = ?, data = ? WHERE key = ?",
+            (item.get("owner_id"), json.dumps(item), item["key"]),
+        )
+
+    def put_if(self, item:dict, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        return self._write_if(item["key"], conditions, lambda previous_item: self._replace(item))
+
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        return self._write_if(key, conditions, lambda previous_item: self._replace({**previous_item, **updates}))
+
+    def delete_if(self, key:str, conditions:dict) -> dict:
+        return self._write_if(
+            key,
+            conditions,
+            lambda previous_item: self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)),
+        )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LazyStorage(ProductStorage):
+    # The storage is created on first use and again in a forked child process,
+    # so clients and connections are never shared between processes.
+    def __init__(self, factory:Callable[[], ProductStorage]):
+        self._factory = factory
+        self._storage = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self) -> ProductStorage:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._storage = self._factory()
+                    self._pid = os.getpid()
+        return self._storage
+
+    @property
+    def is_created(self) -> bool:
+        return self._pid == os.getpid()
+
+    def get(self, key:str) -> Optional[dict]:
+        return self.storage.get(key)
+
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        return self.storage.fetch(query, limit=limit, last=last)
+
+    def insert(self, item:dict) -> dict:
+        return self.storage.insert(item)
+
+    def put(self, item:dict) -> dict:
+        return self.storage.put(item)
+
+    def update(self, updates:dict, key:str):
+        return self.storage.update(updates, key)
+
+    def delete(self, key:str):
+        return self.storage.delete(key)
+
+    def put_many(self, items:list[dict]) -> dict:
+        return self.storage.put_many(items)
+
+    def put_if(self, item:dict, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        return self.storage.put_if(item, conditions, current_item)
+
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:Optional[dict] = None) -> dict:
+        return self.storage.update_if(updates, key, conditions, current_item)
+
+    def delete_if(self, key:str, conditions:dict) -> dict:
+        return self.storage.delete_if(key, conditions)
+
+    def close(self):
+        if self.is_created:
+            self._storage.close()
+
+
+def create_storage(backend:str, base_name:str, project_key:str = None, sqlite_path:str = None) -> ProductStorage:
+    if backend == "deta":
+        return DetaStorage(project_key, base_name)
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path, base_name)
+    if backend == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {', '.join(STORAGE_BACKENDS)}.")
@@ -0,0 +1,84 @@
+from typing import Callable, Optional
+import asyncio
+import errno
+import json
+import os
+import socket
+
+SOCKET_SUFFIX = ".sock"
+
+
+class WorkerChannel:
+    # Every worker binds a Unix datagram socket in a shared directory and sends
+    # its messages to the sockets of all other workers. Messages are best effort:
+    # if a worker's receive buffer is full, the message is dropped.
+    def __init__(self, directory:str, on_message:Callable[[dict], None], name:str = None):
+        self.directory = directory
+        self.on_message = on_message
+        self.path = os.path.join(directory, (name or str(os.getpid())) + SOCKET_SUFFIX)
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.failed = 0
+        self._socket = None
+        self._loop = None
+
+    @property
+    def is_started(self) -> bool:
+        return self._socket is not None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self.path)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._socket.fileno(), self._receive)
+
+    def close(self):
+        if self._socket is None:
+            return
+        self._loop.remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def peers(self) -> list[str]:
+        return [
+            entry.path for entry in os.scandir(self.directory)
+            if entry.name.endswith(SOCKET_SUFFIX) and entry.path != self.path
+        ]
+
+    def publish(self, message:dict, fallback:Optional[dict] = None):
+        if self._socket is None:
+            return
+        data = json.dumps(message).encode("utf-8")
+        for peer in self.peers():
+            try:
+                self._socket.sendto(data, peer)
+                self.sent += 1
+            except OSError as error:
+                if error.errno == errno.EMSGSIZE and fallback is not None:
+                    self.publish(fallback)
+                    return
+                # Also raised for sockets left behind by workers that exited.
+                self.dropped += 1
+
+    def _receive(self):
+        while True:
+            try:
+                data = self._socket.recv(65536 * 4)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.received += 1
+            try:
+                self.on_message(json.loads(data))
+            except Exception:
+                self.failed += 1
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "received": self.received, "dropped": self.dropped, "failed": self.failed}
@@ -0,0 +1,60 @@
+from decouple import config
+import argparse
+import importlib.util
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import uvicorn
+
+HOST = config("HOST", default="0.0.0.0")
+PORT = config("PORT", default=8000, cast=int)
+WORKERS = config("WORKERS", default=0, cast=int)
+BACKLOG = config("BACKLOG", default=2048, cast=int)
+TIMEOUT_KEEP_ALIVE = config("TIMEOUT_KEEP_ALIVE", default=5, cast=int)
+ACCESS_LOG = config("ACCESS_LOG", default=False, cast=bool)
+
+
+def is_installed(module:str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def server_options(host:str, port:int, workers:int, access_log:bool) -> dict:
+    return {
+        "host": host,
+        "port": port,
+        "workers": workers,
+        "loop": "uvloop" if is_installed("uvloop") else "asyncio",
+        "http": "httptools" if is_installed("httptools") else "h11",
+        "lifespan": "on",
+        "backlog": BACKLOG,
+        "timeout_keep_alive": TIMEOUT_KEEP_ALIVE,
+        "access_log": access_log,
+    }
+
+
+def main(argv:list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the product service with multiple worker processes.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes, one per CPU core if 0")
+    parser.add_argument("--access-log", action="store_true", default=ACCESS_LOG)
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+
+    # Workers are spawned and import main on their own, so they find the channel in their environment.
+    channel_dir = None
+    if workers > 1 and not config("WORKER_CHANNEL_DIR", default=None) and hasattr(socket, "AF_UNIX"):
+        channel_dir = tempfile.mkdtemp(prefix="product-service-")
+        os.environ["WORKER_CHANNEL_DIR"] = channel_dir
+    try:
+        uvicorn.run("main:app", **server_options(args.host, args.port, workers, args.access_log))
+    finally:
+        if channel_dir is not None:
+            shutil.rmtree(channel_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+from fastapi import FastAPI, HTTPException, status
+from pydantic import BaseModel
+from collections import Counter
+import asyncio
+import httpx
+
+
+class ComponentIdsModel(BaseModel):
+    componentIds: list[str]
+
+
+class StubComponentsService:
+    def __init__(self, prices:dict[str, float], delay:float = 0.0):
+        self.prices = prices
+        self.delay = delay
+        self.calls = Counter()
+        self.app = self._create_app()
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/components/{component_id}/price")
+        async def get_component_price(component_id:str):
+            self.calls["price"] += 1
+            await asyncio.sleep(self.delay)
+            if component_id not in self.prices:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Component not found.")
+            return {"price": self.prices[component_id]}
+
+        @app.post("/components/prices")
+        async def get_component_prices(body:ComponentIdsModel):
+            self.calls["bulk_price"] += 1
+            await asyncio.sleep(self.delay)
+            return [
+                {"componentId": component_id, "price": self.prices[component_id]}
+                for component_id in body.componentIds
+                if component_id in self.prices
+            ]
+
+        return app
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return httpx.ASGITransport(app=self.app)
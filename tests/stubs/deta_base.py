@@ -0,0 +1,54 @@
+from collections import Counter
+from modules.storage.storage import FetchResponse, ItemExistsError, ItemNotFoundError, MemoryStorage
+import time
+
+
+class FakeDetaBase:
+    # Stands in for deta.Base with the methods DetaStorage uses, raising the same plain exceptions as the Deta SDK.
+    # Every call takes latency seconds, like a round trip to Deta.
+    def __init__(self, latency:float = 0.0):
+        self.items = MemoryStorage()
+        self.calls = Counter()
+        self.latency = latency
+
+    def _call(self, operation:str):
+        self.calls[operation] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def get(self, key:str):
+        self._call("get")
+        return self.items.get(key)
+
+    def fetch(self, query:dict = None, limit:int = 1000, last:str = None) -> FetchResponse:
+        self._call("fetch")
+        return self.items.fetch(query, limit=limit, last=last)
+
+    def insert(self, data:dict) -> dict:
+        self._call("insert")
+        try:
+            return self.items.insert(data)
+        except ItemExistsError:
+            raise Exception(f"Item with key '{data['key']}' already exists")
+
+    def put(self, data:dict) -> dict:
+        self._call("put")
+        return self.items.put(data)
+
+    def update(self, updates:dict, key:str):
+        self._call("update")
+        try:
+            self.items.update(updates, key)
+        except ItemNotFoundError:
+            raise Exception(f"Key '{key}' not found")
+
+    def delete(self, key:str):
+        self._call("delete")
+        self.items.delete(key)
+
+    def put_many(self, items:list[dict]) -> dict:
+        assert len(items) <= 25, "We can't put more than 25 items at a time."
+        self._call("put_many")
+        for item in items:
+            self.items.put(item)
+        return {"processed": {"items": items}}
@@ -0,0 +1,92 @@
+from modules.admission.admission import AdmissionController, AdmissionRejectedError, TokenBucket
+import asyncio
+import pytest
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_refills_at_rate():
+    #ARRANGE
+    bucket = TokenBucket(rate=2.0, burst=3.0, now=0.0)
+    #ACT
+    for _ in range(3):
+        bucket.take(1, now=0.0)
+    #ASSERT
+    assert bucket.wait_time(1, now=0.0) == 0.5
+    assert bucket.wait_time(1, now=0.5) == 0.0
+
+
+def test_token_bucket_goes_into_debt_for_cost_above_burst():
+    #ARRANGE
+    bucket = TokenBucket(rate=2.0, burst=3.0, now=0.0)
+    #ACT
+    wait_time = bucket.wait_time(10, now=0.0)
+    bucket.take(10, now=0.0)
+    #ASSERT
+    assert wait_time == 0.0
+    assert bucket.wait_time(1, now=0.0) == 4.0
+    assert bucket.wait_time(1, now=4.0) == 0.0
+
+
+def test_rejects_calls_of_user_with_full_queue():
+    #ARRANGE
+    timer = FakeTimer()
+    controller = AdmissionController(rate=1.0, burst=1.0, max_concurrency=4, max_queued_per_user=1, timer=timer)
+    async def admit_three_calls():
+        await controller.acquire("user-a")
+        queued_call = asyncio.ensure_future(controller.acquire("user-a"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejectedError) as error:
+            await controller.acquire("user-a")
+        queued_call.cancel()
+        return error.value
+    #ACT
+    error = asyncio.run(admit_three_calls())
+    #ASSERT
+    assert error.retry_after_header() == "2"
+    assert controller.stats()["rejected"] == 1
+    assert controller.stats()["waiting"] == 0
+
+
+def test_free_slots_are_shared_round_robin_between_users():
+    #ARRANGE
+    controller = AdmissionController(rate=0, max_concurrency=1, max_queued_per_user=10)
+    admitted_users = []
+    async def call(user_id:str):
+        await controller.acquire(user_id)
+        admitted_users.append(user_id)
+        await asyncio.sleep(0)
+        controller.release()
+    async def run_calls():
+        # One call holds the only slot while a bulk user queues before a second user.
+        await controller.acquire("user-a")
+        calls = [asyncio.ensure_future(call("user-a")) for _ in range(3)] + [asyncio.ensure_future(call("user-b"))]
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*calls)
+    #ACT
+    asyncio.run(run_calls())
+    #ASSERT
+    assert admitted_users == ["user-b", "user-a", "user-a", "user-a"]
+
+
+def test_queued_call_is_admitted_once_token_is_refilled():
+    #ARRANGE
+    controller = AdmissionController(rate=20.0, burst=1.0, max_concurrency=4, max_queued_per_user=5)
+    async def admit_two_calls():
+        loop = asyncio.get_running_loop()
+        await controller.acquire("user-a")
+        start = loop.time()
+        await controller.acquire("user-a")
+        return loop.time() - start
+    #ACT
+    waited = asyncio.run(admit_two_calls())
+    #ASSERT
+    assert waited >= 0.04
+    assert controller.stats()["admitted"] == 2
@@ -0,0 +1,78 @@
+from modules.circuit_breaker.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+import pytest
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_when_failure_rate_exceeds_threshold():
+    #ARRANGE
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, minimum_calls=4, window_size=10)
+    #ACT
+    for outcome in [True, False, True, False]:
+        breaker.before_call()
+        breaker.record_success() if outcome else breaker.record_failure()
+    #ASSERT
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_stays_closed_below_minimum_calls():
+    #ARRANGE
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, minimum_calls=4)
+    #ACT
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    #ASSERT
+    assert breaker.state == CLOSED
+
+
+def test_breaker_allows_trial_call_after_open_duration():
+    #ARRANGE
+    timer = FakeTimer()
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=30, timer=timer)
+    breaker.before_call()
+    breaker.record_failure()
+    #ACT
+    timer.now = 30
+    breaker.before_call()
+    #ASSERT
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_closes_after_successful_trial_call():
+    #ARRANGE
+    timer = FakeTimer()
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=30, timer=timer)
+    breaker.before_call()
+    breaker.record_failure()
+    timer.now = 30
+    #ACT
+    breaker.before_call()
+    breaker.record_success()
+    #ASSERT
+    assert breaker.state == CLOSED
+
+
+def test_breaker_opens_again_after_failed_trial_call():
+    #ARRANGE
+    timer = FakeTimer()
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=30, timer=timer)
+    breaker.before_call()
+    breaker.record_failure()
+    timer.now = 30
+    #ACT
+    breaker.before_call()
+    breaker.record_failure()
+    #ASSERT
+    assert breaker.state == OPEN
+    assert breaker.stats()["times_opened"] == 2
@@ -0,0 +1,72 @@
+from modules.component_index.component_index import ComponentIndex
+
+
+def create_test_product(key:str, component_ids:list[str]) -> dict:
+    return {"key":key, "owner_id":"test user id", "component_ids":component_ids}
+
+
+def test_index_returns_products_containing_component():
+    #ARRANGE
+    index = ComponentIndex()
+    index.add(create_test_product("product-1", ["component-a", "component-b"]))
+    index.add(create_test_product("product-2", ["component-a"]))
+    #ACT
+    product_keys = index.product_keys("component-a")
+    #ASSERT
+    assert product_keys == {"product-1", "product-2"}
+    assert index.product_keys("component-b") == {"product-1"}
+
+
+def test_index_replaces_components_of_updated_product():
+    #ARRANGE
+    index = ComponentIndex()
+    index.add(create_test_product("product-1", ["component-a"]))
+    #ACT
+    index.add(create_test_product("product-1", ["component-b"]))
+    #ASSERT
+    assert index.product_keys("component-a") == set()
+    assert index.product_keys("component-b") == {"product-1"}
+
+
+def test_index_forgets_removed_product():
+    #ARRANGE
+    index = ComponentIndex()
+    index.add(create_test_product("product-1", ["component-a"]))
+    #ACT
+    index.remove("product-1")
+    #ASSERT
+    assert index.product_keys("component-a") == set()
+
+
+def test_build_replays_changes_made_during_scan():
+    #ARRANGE
+    index = ComponentIndex()
+    scanned_products = [
+        create_test_product("product-1", ["component-a"]),
+        create_test_product("product-2", ["component-a"]),
+    ]
+    index.start_build()
+    index.add(create_test_product("product-1", ["component-b"]))
+    index.remove("product-2")
+    #ACT
+    index.finish_build(scanned_products)
+    #ASSERT
+    assert index.is_built
+    assert index.product_keys("component-a") == set()
+    assert index.product_keys("component-b") == {"product-1"}
+
+
+def test_index_has_to_be_rebuilt_after_max_age():
+    #ARRANGE
+    now = [0.0]
+    index = ComponentIndex(max_age=10.0, timer=lambda: now[0])
+    index.start_build()
+    index.finish_build([create_test_product("product-1", ["component-a"])])
+    #ACT
+    now[0] = 9.0
+    is_built_before_max_age = index.is_built
+    now[0] = 10.0
+    is_built_after_max_age = index.is_built
+    #ASSERT
+    assert is_built_before_max_age
+    assert not is_built_after_max_age
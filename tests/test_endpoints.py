@@ -0,0 +1,445 @@
+from fastapi.testclient import TestClient
+from modules.admission.admission import AdmissionController
+from modules.component_index.component_index import ComponentIndex
+from modules.owner_list_cache.owner_list_cache import OwnerListCache
+from modules.pricing_queue.pricing_queue import PricingQueue
+from modules.product_search.product_search import ProductSearchIndex
+from modules.ttl_cache.ttl_cache import TTLCache
+from tests.stubs.components_service import StubComponentsService
+import modules.storage.storage as storage
+import main
+import pytest
+import time
+
+TEST_USER_ID = "test user id"
+TEST_COMPONENT_PRICES = {
+    "component-a": 10.0,
+    "component-b": 2.5,
+}
+
+
+@pytest.fixture
+def components_service():
+    return StubComponentsService(dict(TEST_COMPONENT_PRICES))
+
+
+@pytest.fixture
+def client(monkeypatch, components_service):
+    # Endpoints run offline against the memory backend and a stub components service.
+    monkeypatch.setattr(main, "productsDB", storage.MemoryStorage())
+    monkeypatch.setattr(main, "product_cache", TTLCache())
+    monkeypatch.setattr(main, "owner_list_cache", OwnerListCache())
+    monkeypatch.setattr(main, "component_index", ComponentIndex())
+    monkeypatch.setattr(main, "product_search_index", ProductSearchIndex())
+    monkeypatch.setattr(main.price_client, "_transport", components_service.transport())
+    main.component_price_cache.clear()
+    with TestClient(main.app) as client:
+        yield client
+
+
+def create_test_product(product_id:str = None, component_ids:list[str] = None, owner_id:str = TEST_USER_ID) -> dict:
+    test_product = {
+        "ownerId":owner_id,
+        "name":"test product",
+        "description":"product of the offline endpoint tests",
+        "componentIds":component_ids if component_ids is not None else ["component-a", "component-b"],
+    }
+    if product_id is not None:
+        test_product["productId"] = product_id
+    return test_product
+
+
+def test_put_batch_rejects_every_item_with_duplicate_product_id(client):
+    #ARRANGE
+    test_products = [create_test_product("product-1"), create_test_product("product-1"), create_test_product("product-2")]
+    #ACT
+    response = client.put("/products:batch", json=test_products, headers={"userId":TEST_USER_ID})
+    #ASSERT
+    status_codes = [result["statusCode"] for result in response.json()["results"]]
+    assert status_codes == [409, 409, 201]
+    assert client.get("/products/product-1", headers={"userId":TEST_USER_ID}).status_code == 404
+
+
+TEST_WEBHOOK_TOKEN = "test webhook token"
+
+
+def test_put_component_price_is_rejected_without_configured_token(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "PRICE_WEBHOOK_TOKEN", None)
+    #ACT
+    response = client.put("/components/component-a/price", json={"price":12.0, "previousPrice":10.0}, headers={"X-Webhook-Token":"any token"})
+    #ASSERT
+    assert response.status_code == 403
+
+
+def test_put_component_price_is_rejected_with_wrong_token(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "PRICE_WEBHOOK_TOKEN", TEST_WEBHOOK_TOKEN)
+    #ACT
+    response = client.put("/components/component-a/price", json={"price":12.0, "previousPrice":10.0}, headers={"X-Webhook-Token":"wrong token"})
+    #ASSERT
+    assert response.status_code == 403
+
+
+def test_put_component_price_adjusts_price_per_contained_component(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "PRICE_WEBHOOK_TOKEN", TEST_WEBHOOK_TOKEN)
+    headers = {"userId":TEST_USER_ID}
+    test_product = create_test_product("product-1", ["component-a", "component-a", "component-b"])
+    assert client.put("/products", json=test_product, headers=headers).json()["price"] == 22.5
+    #ACT
+    response = client.put("/components/component-a/price", json={"price":12.0}, headers={"X-Webhook-Token":TEST_WEBHOOK_TOKEN})
+    replayed_response = client.put("/components/component-a/price", json={"price":12.0, "previousPrice":10.0}, headers={"X-Webhook-Token":TEST_WEBHOOK_TOKEN})
+    #ASSERT
+    assert response.status_code == 200
+    assert response.json()["updatedProductIds"] == ["product-1"]
+    assert replayed_response.json()["updatedProductIds"] == []
+    stored_product = client.get("/products/product-1", headers=headers).json()
+    assert stored_product["price"] == 26.5
+    assert stored_product["version"] == 2
+
+
+def test_put_component_price_reprices_product_after_new_price_was_fetched_for_another(client, components_service, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "PRICE_WEBHOOK_TOKEN", TEST_WEBHOOK_TOKEN)
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    components_service.prices["component-a"] = 12.0
+    main.component_price_cache.clear()
+    client.put("/products", json=create_test_product("product-2", ["component-a"]), headers=headers)
+    #ACT
+    response = client.put("/components/component-a/price", json={"price":12.0, "previousPrice":10.0}, headers={"X-Webhook-Token":TEST_WEBHOOK_TOKEN})
+    #ASSERT
+    assert response.json()["updatedProductIds"] == ["product-1"]
+    assert client.get("/products/product-1", headers=headers).json()["price"] == 14.5
+    assert client.get("/products/product-2", headers=headers).json()["price"] == 12.0
+
+
+class OnceConcurrentlyUpdatedStorage(storage.MemoryStorage):
+    # Another writer changes the product once, between the read and the conditional update.
+    def __init__(self):
+        super().__init__()
+        self.concurrent_updates = 0
+
+    def update_if(self, updates:dict, key:str, conditions:dict, current_item:dict = None) -> dict:
+        if self.concurrent_updates == 0:
+            self.concurrent_updates += 1
+            self.update({"name":"concurrently updated product", "version":self.get(key)["version"] + 1}, key)
+        return super().update_if(updates, key, conditions, current_item)
+
+
+def test_put_component_price_reads_product_again_after_concurrent_write(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "PRICE_WEBHOOK_TOKEN", TEST_WEBHOOK_TOKEN)
+    products_storage = OnceConcurrentlyUpdatedStorage()
+    monkeypatch.setattr(main, "productsDB", products_storage)
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    #ACT
+    response = client.put("/components/component-a/price", json={"price":12.0}, headers={"X-Webhook-Token":TEST_WEBHOOK_TOKEN})
+    #ASSERT
+    assert response.json()["updatedProductIds"] == ["product-1"]
+    assert response.json()["failedProductIds"] == []
+    stored_product = products_storage.get("product-1")
+    assert stored_product["name"] == "concurrently updated product"
+    assert stored_product["price"] == 14.5
+    assert stored_product["version"] == 3
+
+
+def test_product_responses_leave_out_component_prices(client):
+    #ACT
+    response = client.put("/products", json=create_test_product("product-1"), headers={"userId":TEST_USER_ID})
+    #ASSERT
+    assert "componentPrices" not in response.json()
+    assert "componentPrices" not in client.get("/products/product-1", headers={"userId":TEST_USER_ID}).json()
+    assert main.productsDB.get("product-1")["component_prices"] == {"component-a":10.0, "component-b":2.5}
+
+
+def test_put_component_price_requires_known_previous_price(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "PRICE_WEBHOOK_TOKEN", TEST_WEBHOOK_TOKEN)
+    #ACT
+    response = client.put("/components/component-a/price", json={"price":12.0}, headers={"X-Webhook-Token":TEST_WEBHOOK_TOKEN})
+    #ASSERT
+    assert response.status_code == 409
+
+
+class ConcurrentlyModifiedStorage(storage.MemoryStorage):
+    # Another writer changes the product between its read and the conditional write.
+    def put_if(self, item:dict, conditions:dict, current_item:dict = None) -> dict:
+        self.update({"name":"concurrently updated product", "version":99}, item["key"])
+        return super().put_if(item, conditions, current_item)
+
+
+def test_put_batch_rejects_product_modified_concurrently(client, monkeypatch):
+    #ARRANGE
+    products_storage = ConcurrentlyModifiedStorage()
+    products_storage.put({"key":"product-1", "owner_id":TEST_USER_ID, "name":"test product", "description":"", "component_ids":["component-a"], "price":10.0, "version":1})
+    monkeypatch.setattr(main, "productsDB", products_storage)
+    #ACT
+    response = client.put("/products:batch", json=[create_test_product("product-1"), create_test_product("product-2")], headers={"userId":TEST_USER_ID})
+    #ASSERT
+    status_codes = [result["statusCode"] for result in response.json()["results"]]
+    assert status_codes == [412, 201]
+    assert products_storage.get("product-1")["name"] == "concurrently updated product"
+
+
+def test_delete_product_checks_owner_without_reading_first(client):
+    #ARRANGE
+    client.put("/products", json=create_test_product("product-1"), headers={"userId":TEST_USER_ID})
+    #ACT
+    forbidden_response = client.delete("/products/product-1", headers={"userId":"different user id"})
+    response = client.delete("/products/product-1", headers={"userId":TEST_USER_ID})
+    repeated_response = client.delete("/products/product-1", headers={"userId":TEST_USER_ID})
+    #ASSERT
+    assert forbidden_response.status_code == 403
+    assert response.status_code == 204
+    assert repeated_response.status_code == 204
+    assert client.get("/products/product-1", headers={"userId":TEST_USER_ID}).status_code == 404
+
+
+def wait_for_pricing_status(client:TestClient, product_id:str, expected_status:str, timeout:float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        pricing_status = client.get(f"/products/{product_id}/pricing-status", headers={"userId":TEST_USER_ID}).json()
+        if pricing_status["pricingStatus"] == expected_status or time.monotonic() > deadline:
+            return pricing_status
+        time.sleep(0.01)
+
+
+def test_post_product_with_respond_async_is_priced_in_background(client):
+    #ACT
+    response = client.post("/products", json=create_test_product(), headers={"userId":TEST_USER_ID, "Prefer":"respond-async"})
+    #ASSERT
+    assert response.status_code == 202
+    product_id = response.json()["productId"]
+    assert response.headers["Location"] == f"/products/{product_id}/pricing-status"
+    assert response.headers["Preference-Applied"] == "respond-async"
+    assert wait_for_pricing_status(client, product_id, "priced")["pricingStatus"] == "priced"
+    assert client.get(f"/products/{product_id}", headers={"userId":TEST_USER_ID}).json()["price"] == 12.5
+
+
+def test_get_pricing_status_queues_pending_product_without_job_again(client):
+    #ARRANGE
+    main.productsDB.put({
+        "key":"product-1",
+        "owner_id":TEST_USER_ID,
+        "name":"test product",
+        "description":"",
+        "component_ids":["component-a"],
+        "price":None,
+        "pricing_status":"pending",
+        "version":1,
+    })
+    #ACT
+    pricing_status = wait_for_pricing_status(client, "product-1", "priced")
+    #ASSERT
+    assert pricing_status["pricingStatus"] == "priced"
+    assert main.productsDB.get("product-1")["price"] == 10.0
+
+
+def test_patch_product_compares_with_stored_product_instead_of_cached_one(client):
+    #ARRANGE
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    client.get("/products/product-1", headers=headers)
+    main.productsDB.update({"name":"renamed by another worker", "version":2}, "product-1")
+    #ACT
+    response = client.patch("/products/product-1", json={"name":"test product"}, headers=headers)
+    #ASSERT
+    assert response.status_code == 204
+    assert response.headers["ETag"] == '"3"'
+    assert main.productsDB.get("product-1")["name"] == "test product"
+
+
+def test_pricing_beyond_burst_of_user_is_rejected_with_retry_after(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "pricing_admission", AdmissionController(rate=1.0, burst=1, max_queued_per_user=0))
+    headers = {"userId":TEST_USER_ID}
+    #ACT
+    response = client.put("/products", json=create_test_product("product-1"), headers=headers)
+    rejected_response = client.put("/products", json=create_test_product("product-2"), headers=headers)
+    #ASSERT
+    assert response.status_code == 201
+    assert rejected_response.status_code == 429
+    assert rejected_response.headers["Retry-After"] == "1"
+    assert client.get("/products/product-2", headers=headers).status_code == 404
+
+
+def test_rejected_background_pricing_is_retried(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "pricing_admission", AdmissionController(rate=2.0, burst=1, max_queued_per_user=0))
+    monkeypatch.setattr(main, "pricing_queue", PricingQueue(main.price_pending_product, main.mark_pricing_failed, retry_base_delay=0.5))
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    #ACT
+    response = client.put("/products", json=create_test_product("product-2"), headers={**headers, "Prefer":"respond-async"})
+    pricing_status = wait_for_pricing_status(client, "product-2", "priced")
+    #ASSERT
+    assert response.status_code == 202
+    assert pricing_status["pricingStatus"] == "priced"
+    assert pricing_status["attempts"] > 1
+    assert main.pricing_admission.stats()["rejected"] >= 1
+
+
+def create_named_test_products(client:TestClient):
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json={**create_test_product("product-1", ["component-a", "component-b"]), "name":"Alpha widget"}, headers=headers)
+    client.put("/products", json={**create_test_product("product-2", ["component-a"]), "name":"Beta widget"}, headers=headers)
+    client.put("/products", json={**create_test_product("product-3", ["component-b"]), "name":"alpha gadget"}, headers=headers)
+    client.put("/products", json={**create_test_product("product-4", ["component-a"], owner_id="different user id"), "name":"Alpha widget"}, headers={"userId":"different user id"})
+
+
+def test_get_products_filters_and_sorts_with_search_params(client):
+    #ARRANGE
+    create_named_test_products(client)
+    headers = {"userId":TEST_USER_ID}
+    #ACT
+    prefix_response = client.get("/products?namePrefix=alpha&sort=-price", headers=headers)
+    price_response = client.get("/products?minPrice=5&componentId=component-a&sort=price&limit=1", headers=headers)
+    contains_response = client.get("/products?nameContains=WIDGET&maxPrice=11", headers=headers)
+    #ASSERT
+    assert [product["productId"] for product in prefix_response.json()] == ["product-1", "product-3"]
+    assert prefix_response.headers["X-Total-Count"] == "2"
+    assert [product["productId"] for product in price_response.json()] == ["product-2"]
+    assert price_response.headers["X-Total-Count"] == "2"
+    assert [product["productId"] for product in contains_response.json()] == ["product-2"]
+    assert contains_response.headers["X-Total-Count"] == "1"
+
+
+def test_get_products_rejects_search_params_with_last_or_stream(client):
+    #ARRANGE
+    headers = {"userId":TEST_USER_ID}
+    #ACT
+    last_response = client.get("/products?namePrefix=alpha&last=product-1", headers=headers)
+    stream_response = client.get("/products?sort=price&stream=ndjson", headers=headers)
+    #ASSERT
+    assert last_response.status_code == 422
+    assert stream_response.status_code == 422
+
+
+def test_search_index_is_updated_by_writes(client):
+    #ARRANGE
+    create_named_test_products(client)
+    headers = {"userId":TEST_USER_ID}
+    assert client.get("/products?namePrefix=alpha", headers=headers).headers["X-Total-Count"] == "2"
+    #ACT
+    client.patch("/products/product-2", json={"name":"alpha renamed"}, headers=headers)
+    client.delete("/products/product-3", headers=headers)
+    client.post("/products", json={**create_test_product(component_ids=["component-b"]), "name":"Alpha new"}, headers=headers)
+    response = client.get("/products?namePrefix=alpha&sort=name", headers=headers)
+    #ASSERT
+    assert [product["name"] for product in response.json()] == ["Alpha new", "alpha renamed", "Alpha widget"]
+    assert response.headers["X-Total-Count"] == "3"
+
+
+def test_patch_removing_component_missing_upstream_prices_product_completely(client, components_service):
+    #ARRANGE
+    main.productsDB.put({
+        "key":"product-1",
+        "owner_id":TEST_USER_ID,
+        "name":"test product",
+        "description":"",
+        "component_ids":["component-a", "component-b"],
+        "price":12.5,
+        "version":1,
+    })
+    components_service.prices["component-c"] = 1.0
+    del components_service.prices["component-b"]
+    main.component_price_cache.clear()
+    headers = {"userId":TEST_USER_ID}
+    #ACT
+    response = client.patch("/products/product-1", json={"componentIds":["component-a", "component-c"]}, headers=headers)
+    #ASSERT
+    assert response.status_code == 204
+    assert client.get("/products/product-1", headers=headers).json()["price"] == 11.0
+
+
+def test_large_batch_uses_up_pricing_rate_of_user(client, monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(main, "pricing_admission", AdmissionController(rate=1.0, burst=2, max_queued_per_user=0))
+    headers = {"userId":TEST_USER_ID}
+    #ACT
+    batch_response = client.post("/products:batch", json=[create_test_product() for _ in range(10)], headers=headers)
+    rejected_response = client.put("/products", json=create_test_product("product-1"), headers=headers)
+    #ASSERT
+    assert [result["statusCode"] for result in batch_response.json()["results"]] == [201] * 10
+    assert rejected_response.status_code == 429
+    assert rejected_response.headers["Retry-After"] == "9"
+
+
+class ReadCountingStorage(storage.MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, key:str):
+        self.reads += 1
+        return super().get(key)
+
+
+@pytest.fixture
+def products_storage(client, monkeypatch):
+    products_storage = ReadCountingStorage()
+    monkeypatch.setattr(main, "productsDB", products_storage)
+    return products_storage
+
+
+def test_get_product_serves_second_read_from_cache(client, products_storage):
+    #ARRANGE
+    headers = {"userId":TEST_USER_ID}
+    products_storage.put({"key":"product-1", "owner_id":TEST_USER_ID, "name":"test product", "description":"", "component_ids":["component-a"], "price":10.0, "version":1})
+    #ACT
+    first_response = client.get("/products/product-1", headers=headers)
+    second_response = client.get("/products/product-1", headers=headers)
+    #ASSERT
+    assert first_response.json() == second_response.json()
+    assert products_storage.reads == 1
+    assert main.product_cache.stats()["hits"] == 1
+
+
+def test_put_product_replaces_cached_product(client, products_storage):
+    #ARRANGE
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    client.get("/products/product-1", headers=headers)
+    updated_product = create_test_product("product-1", ["component-a"])
+    updated_product["name"] = "updated product"
+    client.put("/products", json=updated_product, headers=headers)
+    products_storage.reads = 0
+    #ACT
+    response = client.get("/products/product-1", headers=headers)
+    #ASSERT
+    assert response.json()["name"] == "updated product"
+    assert response.json()["price"] == 10.0
+    assert response.headers["ETag"] == '"2"'
+    assert products_storage.reads == 0
+
+
+def test_patch_product_replaces_cached_product(client, products_storage):
+    #ARRANGE
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    client.get("/products/product-1", headers=headers)
+    client.patch("/products/product-1", json={"name":"patched product"}, headers=headers)
+    products_storage.reads = 0
+    #ACT
+    response = client.get("/products/product-1", headers=headers)
+    #ASSERT
+    assert response.json()["name"] == "patched product"
+    assert response.headers["ETag"] == '"2"'
+    assert products_storage.reads == 0
+
+
+def test_delete_product_removes_cached_product(client, products_storage):
+    #ARRANGE
+    headers = {"userId":TEST_USER_ID}
+    client.put("/products", json=create_test_product("product-1"), headers=headers)
+    client.get("/products/product-1", headers=headers)
+    client.delete("/products/product-1", headers=headers)
+    products_storage.reads = 0
+    #ACT
+    response = client.get("/products/product-1", headers=headers)
+    #ASSERT
+    assert response.status_code == 404
+    assert products_storage.reads == 1
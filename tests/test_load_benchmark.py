@@ -0,0 +1,55 @@
+from benchmarks.load_benchmark import compare, percentile, summarize
+
+
+def create_results(requests_per_second:float, p95:float) -> dict:
+    return {
+        "endpoints": {
+            "get_product": {
+                "requests_per_second": requests_per_second,
+                "p50": 0.01,
+                "p95": p95,
+                "p99": p95,
+            },
+        },
+    }
+
+
+def test_percentile_uses_nearest_rank():
+    #ARRANGE
+    latencies = [float(value) for value in range(1, 101)]
+    #ACT
+    percentiles = [percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)]
+    #ASSERT
+    assert percentiles == [50.0, 95.0, 99.0]
+
+
+def test_summarize_counts_requests_and_errors():
+    #ARRANGE
+    latencies = [0.1, 0.2, 0.3, 0.4]
+    #ACT
+    summary = summarize(latencies, errors=1, duration=2.0)
+    #ASSERT
+    assert summary["requests"] == 4
+    assert summary["errors"] == 1
+    assert summary["requests_per_second"] == 2.0
+    assert summary["p50"] == 0.2
+
+
+def test_compare_reports_regressions_beyond_threshold():
+    #ARRANGE
+    baseline = create_results(requests_per_second=100.0, p95=0.05)
+    results = create_results(requests_per_second=70.0, p95=0.07)
+    #ACT
+    regressions = compare(results, baseline, threshold=0.2)
+    #ASSERT
+    assert len(regressions) == 3
+
+
+def test_compare_accepts_results_within_threshold():
+    #ARRANGE
+    baseline = create_results(requests_per_second=100.0, p95=0.05)
+    results = create_results(requests_per_second=90.0, p95=0.055)
+    #ACT
+    regressions = compare(results, baseline, threshold=0.2)
+    #ASSERT
+    assert regressions == []
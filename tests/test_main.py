@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from decouple import config
 from main import app
+import json
 import uuid
 
 def test_delete_product_endpoint_success():
@@ -176,7 +177,8 @@ def test_put_endpoint_creates_not_existing_owned_product():
         "name":"test new product",
         "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d","546c08da-539d-11ed-a980-cd9f67f7363d"],
         "description":"new product from put request",
-        "price":638.9
+        "price":638.9,
+        "version":1
     }
     #ACT
     response = client.put("/products",json=test_product, headers={"userId":TEST_USER_ID})
@@ -304,6 +306,31 @@ def test_patch_endpoint_updates_owned_product():
     client.delete(f"/products/{response_product_id}",headers={"userId":TEST_USER_ID})
 
     
+def test_patch_endpoint_updates_only_sent_fields():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    random_test_id = str(uuid.uuid1())
+    test_product = {
+        "productId":random_test_id,
+        "ownerId":TEST_USER_ID,
+        "name":"test new product",
+        "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d","546c08da-539d-11ed-a980-cd9f67f7363d"],
+        "description":"new product from put request",
+    }
+    put_create_response = client.put("/products",json=test_product, headers={"userId":TEST_USER_ID})
+    created_product = put_create_response.json()
+    assert put_create_response.status_code == 201
+    #ACT
+    patch_response = client.patch(f"/products/{random_test_id}",json={"name":"test patched product"}, headers={"userId":TEST_USER_ID})
+    get_response = client.get(f"/products/{random_test_id}",headers={"userId":TEST_USER_ID})
+    #ASSERT
+    assert patch_response.status_code == 204
+    assert get_response.json() == {**created_product, "name":"test patched product", "version":2}
+    #CLEANUP
+    client.delete(f"/products/{random_test_id}",headers={"userId":TEST_USER_ID})
+
+
 def test_patch_endpoint_fails_updating_not_owned_product():
     #ARRANGE
     client = TestClient(app)
@@ -355,4 +382,177 @@ def test_patch_endpoint_fails_updating_not_existing_product():
     # assert patch_response.status_code == 404
     assert patch_response.json() == expected_error
     
-    
\ No newline at end of file
+    
+
+def test_post_products_batch_endpoint_creates_owned_products():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    test_products = [
+        {
+            "ownerId":TEST_USER_ID,
+            "name":f"test new batch product {index}",
+            "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d","546c08da-539d-11ed-a980-cd9f67f7363d"],
+            "description":"new product from batch post request",
+        } for index in range(3)
+    ]
+    #ACT
+    response = client.post("/products:batch",json=test_products, headers={"userId":TEST_USER_ID})
+    #ASSERT
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert [result["statusCode"] for result in results] == [201, 201, 201]
+    for test_product, result in zip(test_products, results):
+        assert test_product.items() <= result["product"].items()
+        assert result["product"]["price"] == 638.9
+    #CLEANUP
+    for result in results:
+        client.delete(f"/products/{result['product']['productId']}",headers={"userId":TEST_USER_ID})
+
+
+def test_post_products_batch_endpoint_rejects_not_owned_items():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    test_products = [
+        {
+            "ownerId":"different user id",
+            "name":"test new batch product",
+            "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d"],
+            "description":"new product from batch post request",
+        }
+    ]
+    expected_result = {
+        "index":0,
+        "statusCode":403,
+        "detail":"Users are only allowed to create products for themselves.",
+    }
+    #ACT
+    response = client.post("/products:batch",json=test_products, headers={"userId":TEST_USER_ID})
+    #ASSERT
+    assert response.status_code == 200
+    assert response.json()["results"] == [expected_result]
+
+
+def test_put_products_batch_endpoint_fails_updating_not_owned_product():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    random_test_id = str(uuid.uuid1())
+    test_product = {
+        "productId":random_test_id,
+        "ownerId":TEST_USER_ID,
+        "name":"test new product",
+        "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d","546c08da-539d-11ed-a980-cd9f67f7363d"],
+        "description":"new product from put request",
+    }
+    updated_test_product = {**test_product, "ownerId":"different user id"}
+    expected_result = {
+        "index":0,
+        "statusCode":403,
+        "detail":"Modifications are only allowed by the owner of the product.",
+    }
+    client.put("/products",json=test_product, headers={"userId":TEST_USER_ID})
+    #ACT
+    response = client.put("/products:batch",json=[updated_test_product], headers={"userId":"different user id"})
+    #ASSERT
+    assert response.status_code == 200
+    assert response.json()["results"] == [expected_result]
+    #CLEANUP
+    client.delete(f"/products/{random_test_id}",headers={"userId":TEST_USER_ID})
+
+
+def test_get_products_endpoint_returns_page_of_products_for_user():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    #ACT
+    response = client.get("/products?limit=1",headers={"userId":TEST_USER_ID})
+    #ASSERT
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.json()[0]["ownerId"] == TEST_USER_ID
+
+
+def test_get_products_endpoint_streams_products_for_user_as_ndjson():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    expected_product = {
+        "productId":"29f6f518-53a8-11ed-a980-cd9f67f7363d",
+        "ownerId":TEST_USER_ID,
+        "name":"test product",
+        "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d","546c08da-539d-11ed-a980-cd9f67f7363d"],
+        "description":"test product for get method",
+        "price":638.9
+    }
+    #ACT
+    response = client.get("/products?stream=ndjson",headers={"userId":TEST_USER_ID})
+    #ASSERT
+    streamed_products = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert expected_product in streamed_products
+
+
+def test_get_products_endpoint_returns_not_modified_for_matching_etag():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    first_response = client.get("/products",headers={"userId":TEST_USER_ID})
+    #ACT
+    response = client.get("/products",headers={"userId":TEST_USER_ID, "If-None-Match":first_response.headers["ETag"]})
+    #ASSERT
+    assert response.status_code == 304
+    assert response.headers["ETag"] == first_response.headers["ETag"]
+
+
+def test_lookup_products_endpoint_returns_found_missing_and_forbidden_ids():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    owned_product_id = "29f6f518-53a8-11ed-a980-cd9f67f7363d"
+    not_existing_product_id = str(uuid.uuid4())
+    #ACT
+    response = client.post(
+        "/products:lookup",
+        json={"productIds":[owned_product_id, not_existing_product_id, owned_product_id]},
+        headers={"userId":TEST_USER_ID},
+    )
+    forbidden_response = client.post(
+        "/products:lookup",
+        json={"productIds":[owned_product_id]},
+        headers={"userId":"different user id"},
+    )
+    #ASSERT
+    assert response.status_code == 200
+    assert [product["productId"] for product in response.json()["products"]] == [owned_product_id]
+    assert response.json()["missingIds"] == [not_existing_product_id]
+    assert response.json()["forbiddenIds"] == []
+    assert forbidden_response.json() == {"products":[], "missingIds":[], "forbiddenIds":[owned_product_id]}
+
+
+def test_put_endpoint_fails_updating_product_with_outdated_version():
+    #ARRANGE
+    client = TestClient(app)
+    TEST_USER_ID = config("TEST_USER_ID")
+    random_test_id = str(uuid.uuid1())
+    test_product = {
+        "productId":random_test_id,
+        "ownerId":TEST_USER_ID,
+        "name":"test new product",
+        "componentIds":["546c08d7-539d-11ed-a980-cd9f67f7363d","546c08da-539d-11ed-a980-cd9f67f7363d"],
+        "description":"new product from put request",
+    }
+    put_create_response = client.put("/products",json=test_product, headers={"userId":TEST_USER_ID})
+    etag = put_create_response.headers["ETag"]
+    put_update_response = client.put("/products",json={**test_product, "name":"test updated product"}, headers={"userId":TEST_USER_ID, "If-Match":etag})
+    #ACT
+    response = client.put("/products",json={**test_product, "name":"test lost update"}, headers={"userId":TEST_USER_ID, "If-Match":etag})
+    #ASSERT
+    assert put_update_response.status_code == 201
+    assert put_update_response.json()["version"] == 2
+    assert response.status_code == 412
+    assert response.headers["ETag"] == put_update_response.headers["ETag"]
+    #CLEANUP
+    client.delete(f"/products/{random_test_id}",headers={"userId":TEST_USER_ID})
@@ -0,0 +1,90 @@
+from modules.metrics.metrics import InstrumentedStorage, MetricsMiddleware, MetricsRegistry
+from modules.storage.storage import MemoryStorage
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+def test_histogram_renders_cumulative_buckets():
+    #ARRANGE
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("operation",), buckets=(0.1, 1.0))
+    #ACT
+    histogram.observe(0.05, "get")
+    histogram.observe(0.5, "get")
+    histogram.observe(5.0, "get")
+    rendered = registry.render()
+    #ASSERT
+    assert 'latency_seconds_bucket{operation="get",le="0.1"} 1' in rendered
+    assert 'latency_seconds_bucket{operation="get",le="1.0"} 2' in rendered
+    assert 'latency_seconds_bucket{operation="get",le="+Inf"} 3' in rendered
+    assert 'latency_seconds_count{operation="get"} 3' in rendered
+    assert "# TYPE latency_seconds histogram" in rendered
+
+
+def test_counter_escapes_label_values():
+    #ARRANGE
+    registry = MetricsRegistry()
+    counter = registry.counter("errors_total", "Errors.", ("error",))
+    #ACT
+    counter.inc('quoted "value"')
+    counter.inc('quoted "value"')
+    #ASSERT
+    assert 'errors_total{error="quoted \\"value\\""} 2' in registry.render()
+
+
+def test_registry_rejects_duplicate_metric_names():
+    #ARRANGE
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Errors.")
+    #ACT
+    try:
+        registry.counter("errors_total", "Errors.")
+        raised = False
+    except ValueError:
+        raised = True
+    #ASSERT
+    assert raised
+
+
+def test_instrumented_storage_records_duration_and_errors_per_operation():
+    #ARRANGE
+    registry = MetricsRegistry()
+    duration = registry.histogram("storage_seconds", "Storage latency.", ("operation",))
+    errors = registry.counter("storage_errors_total", "Storage errors.", ("operation",))
+    storage = InstrumentedStorage(MemoryStorage(), duration=duration, errors=errors)
+    #ACT
+    storage.put({"key": "product-a", "owner_id": "user-a"})
+    storage.get("product-a")
+    try:
+        storage.update({"name": "new name"}, "not-existing-product")
+    except Exception:
+        pass
+    #ASSERT
+    assert duration.count("put") == 1
+    assert duration.count("get") == 1
+    assert duration.count("update") == 1
+    assert errors.value("update") == 1
+    assert errors.value("get") == 0
+
+
+def test_middleware_labels_requests_with_route_template_and_status():
+    #ARRANGE
+    registry = MetricsRegistry()
+    duration = registry.histogram("request_seconds", "Request latency.", ("method", "route", "status"))
+    requests = registry.counter("requests_total", "Requests.", ("method", "route", "status"))
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, duration=duration, requests=requests)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id:str):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    #ACT
+    client.get("/items/a")
+    client.get("/items/b")
+    client.get("/not-existing-route")
+    #ASSERT
+    assert requests.value("GET", "/items/{item_id}", "200") == 2
+    assert requests.value("GET", "unmatched", "404") == 1
+    assert duration.count("GET", "/items/{item_id}", "200") == 2
@@ -0,0 +1,44 @@
+from modules.owner_list_cache.owner_list_cache import OwnerListCache, etag_matches
+
+
+def test_cached_list_is_returned_with_etag():
+    #ARRANGE
+    cache = OwnerListCache()
+    etag = cache.set("test user id", cache.version("test user id"), b"[]")
+    #ACT
+    cached_list = cache.get("test user id")
+    #ASSERT
+    assert cached_list == (b"[]", etag)
+    assert etag.startswith('"') and etag.endswith('"')
+
+
+def test_bump_invalidates_cached_list():
+    #ARRANGE
+    cache = OwnerListCache()
+    cache.set("test user id", cache.version("test user id"), b"[]")
+    #ACT
+    cache.bump("test user id")
+    #ASSERT
+    assert cache.get("test user id") is None
+
+
+def test_list_built_before_concurrent_bump_is_not_cached():
+    #ARRANGE
+    cache = OwnerListCache()
+    version = cache.version("test user id")
+    cache.bump("test user id")
+    #ACT
+    cache.set("test user id", version, b"[]")
+    #ASSERT
+    assert cache.get("test user id") is None
+
+
+def test_etag_matches_if_none_match_header_values():
+    #ARRANGE
+    etag = '"abc"'
+    #ACT / ASSERT
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"xyz"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,306 @@
+from modules.circuit_breaker.circuit_breaker import CircuitBreaker
+from modules.ttl_cache.ttl_cache import TTLCache
+from tests.stubs.components_service import StubComponentsService
+import modules.pricing.pricing as pricing
+import asyncio
+import httpx
+import threading
+import time
+
+TEST_COMPONENT_PRICES = {
+    "component-a": 100.5,
+    "component-b": 20.25,
+    "component-c": 3.0,
+}
+
+
+def create_price_transport(delay:float = 0.0, prices:dict = TEST_COMPONENT_PRICES):
+    async def handler(request:httpx.Request):
+        await asyncio.sleep(delay)
+        component_id = request.url.path.split("/")[2]
+        if component_id not in prices:
+            return httpx.Response(404, json={"detail": "Component not found."})
+        return httpx.Response(200, json={"price": prices[component_id]})
+    return httpx.MockTransport(handler)
+
+
+def test_calculate_price_sums_component_prices():
+    #ARRANGE
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=create_price_transport())
+    #ACT
+    price = asyncio.run(client.calculate_price(["component-a", "component-b", "component-c"]))
+    #ASSERT
+    assert price == 123.75
+
+
+def test_calculate_price_fetches_components_concurrently():
+    #ARRANGE
+    delay = 0.2
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        max_concurrency=10,
+        transport=create_price_transport(delay=delay),
+    )
+    component_ids = ["component-a"] * 10
+    #ACT
+    start = time.perf_counter()
+    price = asyncio.run(client.calculate_price(component_ids))
+    elapsed = time.perf_counter() - start
+    #ASSERT
+    assert price == 1005
+    assert elapsed < delay * 3
+
+
+def test_calculate_price_respects_concurrency_limit():
+    #ARRANGE
+    in_flight = 0
+    max_in_flight = 0
+    async def handler(request:httpx.Request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"price": 1.0})
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        max_concurrency=3,
+        transport=httpx.MockTransport(handler),
+    )
+    #ACT
+    price = asyncio.run(client.calculate_price([f"component-{index}" for index in range(12)]))
+    #ASSERT
+    assert price == 12
+    assert max_in_flight == 3
+
+
+def test_calculate_price_fails_for_not_existing_component():
+    #ARRANGE
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=create_price_transport())
+    #ACT
+    try:
+        asyncio.run(client.calculate_price(["component-a", "not-existing-component"]))
+        raised = False
+    except httpx.HTTPStatusError:
+        raised = True
+    #ASSERT
+    assert raised
+
+
+def test_get_price_serves_repeated_lookups_from_cache():
+    #ARRANGE
+    requested_paths = []
+    def handler(request:httpx.Request):
+        requested_paths.append(request.url.path)
+        return httpx.Response(200, json={"price": 10.0})
+    cache = TTLCache(max_size=10, ttl=60)
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        cache=cache,
+        transport=httpx.MockTransport(handler),
+    )
+    async def price_twice():
+        await client.calculate_price(["component-a"])
+        return await client.calculate_price(["component-a"])
+    #ACT
+    price = asyncio.run(price_twice())
+    #ASSERT
+    assert price == 10.0
+    assert requested_paths == ["/components/component-a/price"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_price_coalesces_concurrent_misses():
+    #ARRANGE
+    requested_paths = []
+    async def handler(request:httpx.Request):
+        requested_paths.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"price": 10.0})
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        cache=TTLCache(max_size=10, ttl=60),
+        transport=httpx.MockTransport(handler),
+    )
+    #ACT
+    price = asyncio.run(client.calculate_price(["component-a"] * 5))
+    #ASSERT
+    assert price == 50.0
+    assert requested_paths == ["/components/component-a/price"]
+
+
+def test_calculate_price_fetches_duplicate_components_once():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES)
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=components_service.transport())
+    #ACT
+    price = asyncio.run(client.calculate_price(["component-a", "component-b", "component-a", "component-a"]))
+    #ASSERT
+    assert price == 100.5 * 3 + 20.25
+    assert components_service.calls["price"] == 2
+
+
+def test_calculate_price_uses_bulk_lookup_when_configured():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES)
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        bulk_price_path="/components/prices",
+        transport=components_service.transport(),
+    )
+    #ACT
+    price = asyncio.run(client.calculate_price(["component-a", "component-b", "component-c", "component-b"]))
+    #ASSERT
+    assert price == 100.5 + 20.25 * 2 + 3.0
+    assert components_service.calls["bulk_price"] == 1
+    assert components_service.calls["price"] == 0
+
+
+def test_calculate_price_splits_bulk_lookup_into_chunks():
+    #ARRANGE
+    prices = {f"component-{index}": 1.0 for index in range(25)}
+    components_service = StubComponentsService(prices)
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        bulk_price_path="/components/prices",
+        bulk_max_ids=10,
+        transport=components_service.transport(),
+    )
+    #ACT
+    price = asyncio.run(client.calculate_price(list(prices)))
+    #ASSERT
+    assert price == 25.0
+    assert components_service.calls["bulk_price"] == 3
+
+
+def test_calculate_price_with_bulk_lookup_fails_for_not_existing_component():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES)
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        bulk_price_path="/components/prices",
+        transport=components_service.transport(),
+    )
+    #ACT
+    try:
+        asyncio.run(client.calculate_price(["component-a", "not-existing-component"]))
+        raised = False
+    except pricing.ComponentPriceNotFoundError:
+        raised = True
+    #ASSERT
+    assert raised
+
+
+def test_quote_price_falls_back_to_stale_price_when_breaker_is_open():
+    #ARRANGE
+    async def handler(request:httpx.Request):
+        return httpx.Response(503)
+    timer_now = [0.0]
+    cache = TTLCache(max_size=10, ttl=60, timer=lambda: timer_now[0])
+    cache.set("component-a", 100.5)
+    timer_now[0] = 120.0
+    breaker = CircuitBreaker(minimum_calls=1)
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        cache=cache,
+        circuit_breaker=breaker,
+        transport=httpx.MockTransport(handler),
+    )
+    #ACT
+    first_quote = asyncio.run(client.quote_price(["component-a"]))
+    second_quote = asyncio.run(client.quote_price(["component-a"]))
+    #ASSERT
+    assert first_quote == pricing.PriceQuote(100.5, True, {"component-a":100.5})
+    assert second_quote == pricing.PriceQuote(100.5, True, {"component-a":100.5})
+    assert breaker.stats()["rejected_calls"] == 1
+
+
+def test_quote_price_returns_stale_price_when_timeout_budget_is_exceeded():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES, delay=1.0)
+    cache = TTLCache(max_size=10, ttl=0)
+    cache.set("component-a", 99.0)
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        cache=cache,
+        timeout_budget=0.05,
+        transport=components_service.transport(),
+    )
+    #ACT
+    start = time.perf_counter()
+    quote = asyncio.run(client.quote_price(["component-a"]))
+    elapsed = time.perf_counter() - start
+    #ASSERT
+    assert quote == pricing.PriceQuote(99.0, True, {"component-a":99.0})
+    assert elapsed < 0.5
+
+
+def test_observe_request_receives_duration_and_error_per_request():
+    #ARRANGE
+    observed_requests = []
+    client = pricing.ComponentPriceClient(
+        base_url="http://components",
+        transport=create_price_transport(),
+        observe_request=lambda operation, duration, error: observed_requests.append((operation, error)),
+    )
+    #ACT
+    asyncio.run(client.get_prices(["component-a", "not-existing-component"], return_exceptions=True))
+    #ASSERT
+    error_types = sorted(pricing.upstream_error_type(error) if error else "none" for operation, error in observed_requests)
+    assert [operation for operation, error in observed_requests] == ["price", "price"]
+    assert error_types == ["http_4xx", "none"]
+
+
+def test_quote_price_change_only_fetches_added_and_removed_components():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES)
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=components_service.transport())
+    previous_component_ids = ["component-a", "component-b", "component-b"]
+    #ACT
+    quote = asyncio.run(client.quote_price_change(previous_component_ids, 141.0, ["component-a", "component-b", "component-c"]))
+    #ASSERT
+    assert quote == pricing.PriceQuote(141.0 - 20.25 + 3.0, False, {"component-c":3.0})
+    assert components_service.calls["price"] == 2
+
+
+def test_quote_price_change_subtracts_known_price_of_removed_component():
+    #ARRANGE
+    components_service = StubComponentsService({"component-a": 100.5, "component-c": 3.0})
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=components_service.transport())
+    previous_component_prices = {"component-a":100.5, "component-b":20.0}
+    #ACT
+    quote = asyncio.run(client.quote_price_change(["component-a", "component-b"], 120.5, ["component-a", "component-c"], previous_component_prices))
+    #ASSERT
+    assert quote == pricing.PriceQuote(103.5, False, {"component-a":100.5, "component-c":3.0})
+    assert components_service.calls["price"] == 1
+
+
+def test_quote_price_change_without_changed_components_requests_nothing():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES)
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=components_service.transport())
+    #ACT
+    quote = asyncio.run(client.quote_price_change(["component-a", "component-b"], 120.75, ["component-b", "component-a"]))
+    #ASSERT
+    assert quote == pricing.PriceQuote(120.75, False, {})
+    assert components_service.calls["price"] == 0
+
+
+def test_client_of_previous_loop_is_closed_when_used_from_new_loop():
+    #ARRANGE
+    components_service = StubComponentsService(TEST_COMPONENT_PRICES)
+    client = pricing.ComponentPriceClient(base_url="http://components", transport=components_service.transport())
+    previous_loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=previous_loop.run_forever)
+    loop_thread.start()
+    asyncio.run_coroutine_threadsafe(client.calculate_price(["component-a"]), previous_loop).result()
+    previous_client = client._client
+    #ACT
+    asyncio.run(client.calculate_price(["component-b"]))
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), previous_loop).result()
+    previous_loop.call_soon_threadsafe(previous_loop.stop)
+    loop_thread.join()
+    previous_loop.close()
+    #ASSERT
+    assert previous_client.is_closed
+    assert client._client is not previous_client
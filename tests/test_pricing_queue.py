@@ -0,0 +1,92 @@
+from modules.pricing_queue.pricing_queue import PricingQueue, PricingQueueFullError
+import asyncio
+
+
+def test_queue_prices_submitted_products_in_background():
+    #ARRANGE
+    priced_keys = []
+    async def price_product(product_key:str):
+        priced_keys.append(product_key)
+    async def mark_failed(product_key:str):
+        pass
+    queue = PricingQueue(price_product, mark_failed, workers=2)
+    async def submit_and_drain():
+        queue.submit("product-1")
+        queue.submit("product-2")
+        await queue.stop()
+    #ACT
+    asyncio.run(submit_and_drain())
+    #ASSERT
+    assert sorted(priced_keys) == ["product-1", "product-2"]
+    assert queue.status("product-1") == {"state": "done", "attempts": 1}
+
+
+def test_queue_retries_failed_pricing_with_backoff():
+    #ARRANGE
+    attempts = []
+    async def price_product(product_key:str):
+        attempts.append(product_key)
+        if len(attempts) < 3:
+            raise ConnectionError("Components service unavailable.")
+    async def mark_failed(product_key:str):
+        pass
+    queue = PricingQueue(price_product, mark_failed, workers=1, max_attempts=3, retry_base_delay=0.01)
+    async def submit_and_drain():
+        queue.submit("product-1")
+        await queue.stop()
+    #ACT
+    asyncio.run(submit_and_drain())
+    #ASSERT
+    assert len(attempts) == 3
+    assert queue.status("product-1") == {"state": "done", "attempts": 3}
+
+
+def test_queue_marks_product_failed_after_last_attempt():
+    #ARRANGE
+    failed_keys = []
+    async def price_product(product_key:str):
+        raise ConnectionError("Components service unavailable.")
+    async def mark_failed(product_key:str):
+        failed_keys.append(product_key)
+    queue = PricingQueue(price_product, mark_failed, workers=1, max_attempts=2, retry_base_delay=0.01)
+    async def submit_and_drain():
+        queue.submit("product-1")
+        await queue.stop()
+    #ACT
+    asyncio.run(submit_and_drain())
+    #ASSERT
+    assert failed_keys == ["product-1"]
+    assert queue.status("product-1") == {"state": "failed", "attempts": 2}
+
+
+def test_queue_rejects_products_when_full():
+    #ARRANGE
+    async def price_product(product_key:str):
+        await asyncio.sleep(1)
+    async def mark_failed(product_key:str):
+        pass
+    queue = PricingQueue(price_product, mark_failed, workers=1, max_size=1)
+    async def overfill():
+        queue.submit("product-1")
+        try:
+            queue.submit("product-2")
+            return False
+        except PricingQueueFullError:
+            return queue.is_full()
+        finally:
+            await queue.stop(drain_timeout=0)
+    #ACT
+    rejected = asyncio.run(overfill())
+    #ASSERT
+    assert rejected
+
+
+def test_retry_delay_grows_exponentially_up_to_maximum():
+    #ARRANGE
+    queue = PricingQueue(None, None, retry_base_delay=1.0, retry_max_delay=4.0)
+    #ACT
+    delays = [queue.retry_delay(attempt) for attempt in range(1, 6)]
+    #ASSERT
+    assert 0.5 <= delays[0] <= 1.0
+    assert 1.0 <= delays[1] <= 2.0
+    assert all(2.0 <= delay <= 4.0 for delay in delays[2:])
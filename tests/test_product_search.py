@@ -0,0 +1,88 @@
+from modules.product_search.product_search import OwnerProducts, ProductQuery, ProductSearchIndex
+
+
+def create_test_product(key:str, name:str, price:float, component_ids:list[str]) -> dict:
+    return {"key":key, "owner_id":"test user id", "name":name, "price":price, "component_ids":component_ids}
+
+
+def create_test_products() -> list[dict]:
+    return [
+        create_test_product("product-1", "Red Chair", 10.0, ["component-a"]),
+        create_test_product("product-2", "Blue chair", 25.0, ["component-a", "component-b"]),
+        create_test_product("product-3", "Table", 40.0, ["component-c"]),
+        create_test_product("product-4", "Red table", None, ["component-b"]),
+    ]
+
+
+def result_keys(result) -> list[str]:
+    return [product["key"] for product in result.products]
+
+
+def test_search_filters_by_name_prefix_and_substring():
+    #ARRANGE
+    owner_products = OwnerProducts(create_test_products())
+    #ACT
+    prefix_result = owner_products.search(ProductQuery(name_prefix="red"))
+    substring_result = owner_products.search(ProductQuery(name_contains="CHAIR"))
+    short_substring_result = owner_products.search(ProductQuery(name_contains="ab"))
+    #ASSERT
+    assert result_keys(prefix_result) == ["product-1", "product-4"]
+    assert result_keys(substring_result) == ["product-1", "product-2"]
+    assert result_keys(short_substring_result) == ["product-3", "product-4"]
+
+
+def test_search_combines_price_range_and_component():
+    #ARRANGE
+    owner_products = OwnerProducts(create_test_products())
+    #ACT
+    result = owner_products.search(ProductQuery(min_price=10.0, max_price=25.0, component_id="component-b"))
+    #ASSERT
+    assert result_keys(result) == ["product-2"]
+    assert result.total == 1
+
+
+def test_search_sorts_unpriced_products_last_and_applies_limit():
+    #ARRANGE
+    owner_products = OwnerProducts(create_test_products())
+    #ACT
+    descending_result = owner_products.search(ProductQuery(sort="-price"))
+    limited_result = owner_products.search(ProductQuery(sort="name", limit=2))
+    #ASSERT
+    assert result_keys(descending_result) == ["product-3", "product-2", "product-1", "product-4"]
+    assert result_keys(limited_result) == ["product-2", "product-1"]
+    assert limited_result.total == 4
+
+
+def test_search_reflects_updated_and_removed_products():
+    #ARRANGE
+    owner_products = OwnerProducts(create_test_products())
+    #ACT
+    owner_products.add(create_test_product("product-3", "Red lamp", 5.0, ["component-a"]))
+    owner_products.remove("product-1")
+    #ASSERT
+    assert result_keys(owner_products.search(ProductQuery(name_prefix="red", sort="price"))) == ["product-3", "product-4"]
+    assert result_keys(owner_products.search(ProductQuery(component_id="component-c"))) == []
+    assert result_keys(owner_products.search(ProductQuery(max_price=20.0))) == ["product-3"]
+
+
+def test_index_replays_writes_made_while_loading():
+    #ARRANGE
+    index = ProductSearchIndex()
+    scanned_products = create_test_products()
+    index.start_load("test user id")
+    index.add(create_test_product("product-5", "Desk", 60.0, ["component-d"]))
+    index.remove(scanned_products[0])
+    #ACT
+    index.finish_load("test user id", scanned_products)
+    result = index.search("test user id", ProductQuery(sort="price"))
+    #ASSERT
+    assert result_keys(result) == ["product-2", "product-3", "product-5", "product-4"]
+
+
+def test_index_ignores_writes_of_owners_not_loaded():
+    #ARRANGE
+    index = ProductSearchIndex()
+    #ACT
+    index.add(create_test_product("product-1", "Red Chair", 10.0, ["component-a"]))
+    #ASSERT
+    assert index.search("test user id", ProductQuery()) is None
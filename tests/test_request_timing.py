@@ -0,0 +1,67 @@
+from modules.request_timing.request_timing import ServerTimingMiddleware, TimedRoute
+from modules.ttl_cache.ttl_cache import TTLCache
+import modules.request_timing.request_timing as request_timing
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+def create_timed_app(enabled:bool = False, token:str = None, profiles:TTLCache = None) -> FastAPI:
+    app = FastAPI()
+    app.router.route_class = TimedRoute
+    app.add_middleware(ServerTimingMiddleware, enabled=enabled, token=token, profiles=profiles)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id:str):
+        request_timing.record("db-get", 0.005)
+        with request_timing.timed("pricing"):
+            pass
+        return {"id": item_id}
+
+    return app
+
+
+def test_server_timing_header_lists_recorded_stages():
+    #ARRANGE
+    client = TestClient(create_timed_app(enabled=True))
+    #ACT
+    response = client.get("/items/a")
+    #ASSERT
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert response.status_code == 200
+    assert stages == ["db-get", "pricing", "serialize", "total"]
+    assert "db-get;dur=5.00" in response.headers["Server-Timing"]
+
+
+def test_server_timing_requires_valid_token_if_not_enabled():
+    #ARRANGE
+    client = TestClient(create_timed_app(token="debug-token"))
+    #ACT
+    response_without_token = client.get("/items/a")
+    response_with_wrong_token = client.get("/items/a", headers={"X-Debug-Token": "wrong-token"})
+    response_with_token = client.get("/items/a", headers={"X-Debug-Token": "debug-token"})
+    #ASSERT
+    assert "Server-Timing" not in response_without_token.headers
+    assert "Server-Timing" not in response_with_wrong_token.headers
+    assert "Server-Timing" in response_with_token.headers
+
+
+def test_profile_is_stored_for_authorized_profile_requests():
+    #ARRANGE
+    profiles = TTLCache(max_size=2, ttl=60)
+    client = TestClient(create_timed_app(enabled=True, token="debug-token", profiles=profiles))
+    #ACT
+    unauthorized_response = client.get("/items/a", headers={"X-Debug-Profile": "1"})
+    response = client.get("/items/a", headers={"X-Debug-Token": "debug-token", "X-Debug-Profile": "1"})
+    #ASSERT
+    assert "X-Profile-Id" not in unauthorized_response.headers
+    assert "function calls" in profiles.get(response.headers["X-Profile-Id"])
+    assert len(profiles) == 1
+
+
+def test_record_outside_of_timed_request_is_ignored():
+    #ACT
+    request_timing.record("db-get", 0.005)
+    with request_timing.timed("pricing"):
+        pass
+    #ASSERT
+    assert request_timing._current_timings.get() is None
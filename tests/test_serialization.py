@@ -0,0 +1,54 @@
+from models import product_models
+import modules.serialization.serialization as serialization
+import json
+
+
+def create_stored_product() -> dict:
+    return {
+        "key": "product-a",
+        "owner_id": "test user id",
+        "name": "test product",
+        "description": "test product for serialization",
+        "component_ids": ["component-a", "component-b"],
+        "price": 10.5,
+    }
+
+
+def test_trusted_serialization_matches_response_model():
+    #ARRANGE
+    stored_product = create_stored_product()
+    aliases = serialization.field_aliases(product_models.ProductResponseModel)
+    #ACT
+    trusted_product = serialization.to_aliases(stored_product, aliases)
+    validated_product = product_models.ProductResponseModel(**stored_product).dict(by_alias=True, exclude_unset=True)
+    #ASSERT
+    assert trusted_product == validated_product
+    assert json.loads(serialization.dumps(trusted_product)) == validated_product
+
+
+def test_to_aliases_drops_fields_unknown_to_the_model():
+    #ARRANGE
+    stored_product = {**create_stored_product(), "__expires": 1234}
+    aliases = serialization.field_aliases(product_models.ProductResponseModel)
+    #ACT
+    trusted_product = serialization.to_aliases(stored_product, aliases)
+    #ASSERT
+    assert "__expires" not in trusted_product
+    assert trusted_product["productId"] == "product-a"
+
+
+def test_dumps_falls_back_to_standard_library(monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(serialization, "orjson", None)
+    #ACT
+    body = serialization.dumps({"name": "prodüct", "price": 1.5})
+    #ASSERT
+    assert body == '{"name":"prodüct","price":1.5}'.encode("utf-8")
+
+
+def test_fast_json_response_renders_compact_utf8():
+    #ACT
+    response = serialization.FastJSONResponse(content={"name": "prodüct"})
+    #ASSERT
+    assert response.body == '{"name":"prodüct"}'.encode("utf-8")
+    assert response.media_type == "application/json"
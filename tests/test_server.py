@@ -0,0 +1,22 @@
+import server
+
+
+def test_server_options_fall_back_to_pure_python_loop_and_parser(monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(server, "is_installed", lambda module: False)
+    #ACT
+    options = server.server_options("127.0.0.1", 8000, 4, access_log=False)
+    #ASSERT
+    assert options["loop"] == "asyncio"
+    assert options["http"] == "h11"
+    assert options["workers"] == 4
+
+
+def test_server_options_prefer_uvloop_and_httptools(monkeypatch):
+    #ARRANGE
+    monkeypatch.setattr(server, "is_installed", lambda module: True)
+    #ACT
+    options = server.server_options("127.0.0.1", 8000, 4, access_log=False)
+    #ASSERT
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
@@ -0,0 +1,36 @@
+from benchmarks import import_benchmark
+import json
+import subprocess
+import sys
+
+# Matches the budget in the README, the import takes about 0.3s on a developer machine.
+STARTUP_BUDGET = 1.0
+
+
+def test_main_is_imported_within_startup_budget():
+    #ACT
+    import_seconds = min(import_benchmark.measure_import_seconds("main") for _ in range(3))
+    #ASSERT
+    assert import_seconds < STARTUP_BUDGET
+
+
+def test_main_import_defers_clients_and_openapi_schema():
+    #ARRANGE
+    code = (
+        "import json, sys, main; "
+        "print(json.dumps({'httpx': 'httpx' in sys.modules, 'storage': main.productsDB.storage.is_created, 'openapi': main.app.openapi_schema is not None}))"
+    )
+    #ACT
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    #ASSERT
+    assert json.loads(completed.stdout) == {"httpx": False, "storage": False, "openapi": False}
+
+
+def test_parse_importtime_reads_self_and_cumulative_time():
+    #ARRANGE
+    output = "import time: self [us] | cumulative | imported package\nimport time:       120 |        450 |   modules.pricing.pricing\n"
+    #ACT
+    modules = import_benchmark.parse_importtime(output)
+    #ASSERT
+    assert modules == [{"module": "modules.pricing.pricing", "self_us": 120, "cumulative_us": 450}]
+    assert import_benchmark.summarize_packages(modules) == {"modules": 120}
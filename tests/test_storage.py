@@ -0,0 +1,251 @@
+from tests.stubs.deta_base import FakeDetaBase
+import modules.storage.storage as storage
+import pytest
+import threading
+
+
+def create_test_product(key:str, owner_id:str = "test user id") -> dict:
+    return {
+        "key":key,
+        "owner_id":owner_id,
+        "name":"test product",
+        "description":"test product for storage",
+        "component_ids":["component-a", "component-b"],
+        "price":10.5,
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite", "deta"])
+def products_storage(request, tmp_path):
+    if request.param == "deta":
+        products_storage = storage.DetaStorage(None, "products", base=FakeDetaBase())
+    else:
+        products_storage = storage.create_storage(
+            request.param,
+            base_name="products",
+            sqlite_path=str(tmp_path / "products.sqlite3"),
+        )
+    yield products_storage
+    products_storage.close()
+
+
+def test_put_and_get_product(products_storage):
+    #ARRANGE
+    test_product = create_test_product("product-1")
+    #ACT
+    products_storage.put(test_product)
+    #ASSERT
+    assert products_storage.get("product-1") == test_product
+    assert products_storage.get("not-existing-product") is None
+
+
+def test_insert_fails_for_existing_key(products_storage):
+    #ARRANGE
+    products_storage.insert(create_test_product("product-1"))
+    #ACT / ASSERT
+    with pytest.raises(storage.ItemExistsError):
+        products_storage.insert(create_test_product("product-1"))
+
+
+def test_update_changes_only_given_fields(products_storage):
+    #ARRANGE
+    products_storage.put(create_test_product("product-1"))
+    #ACT
+    products_storage.update({"name":"updated product", "price":1.0}, "product-1")
+    #ASSERT
+    updated_product = products_storage.get("product-1")
+    assert updated_product["name"] == "updated product"
+    assert updated_product["price"] == 1.0
+    assert updated_product["description"] == "test product for storage"
+
+
+def test_update_fails_for_not_existing_key(products_storage):
+    #ACT / ASSERT
+    with pytest.raises(storage.ItemNotFoundError):
+        products_storage.update({"name":"updated product"}, "not-existing-product")
+
+
+def test_delete_removes_product(products_storage):
+    #ARRANGE
+    products_storage.put(create_test_product("product-1"))
+    #ACT
+    products_storage.delete("product-1")
+    products_storage.delete("not-existing-product")
+    #ASSERT
+    assert products_storage.get("product-1") is None
+
+
+def test_fetch_filters_by_owner_and_paginates(products_storage):
+    #ARRANGE
+    products_storage.put_many([create_test_product(f"product-{index:02}") for index in range(5)])
+    products_storage.put(create_test_product("product-other", owner_id="different user id"))
+    #ACT
+    first_page = products_storage.fetch({"owner_id":"test user id"}, limit=3)
+    second_page = products_storage.fetch({"owner_id":"test user id"}, limit=3, last=first_page.last)
+    #ASSERT
+    assert [product["key"] for product in first_page.items] == ["product-00", "product-01", "product-02"]
+    assert first_page.last == "product-02"
+    assert [product["key"] for product in second_page.items] == ["product-03", "product-04"]
+    assert second_page.last is None
+
+
+def test_fetch_filters_by_other_fields(products_storage):
+    #ARRANGE
+    products_storage.put(create_test_product("product-1"))
+    products_storage.put({**create_test_product("product-2"), "name":"other product"})
+    #ACT
+    response = products_storage.fetch({"name":"other product"})
+    #ASSERT
+    assert [product["key"] for product in response.items] == ["product-2"]
+
+
+def test_put_many_fails_for_too_many_items(products_storage):
+    #ARRANGE
+    test_products = [create_test_product(f"product-{index}") for index in range(storage.PUT_MANY_LIMIT + 1)]
+    #ACT / ASSERT
+    with pytest.raises(storage.StorageError):
+        products_storage.put_many(test_products)
+
+
+def test_put_if_replaces_product_if_conditions_match(products_storage):
+    #ARRANGE
+    products_storage.put({**create_test_product("product-1"), "version":1})
+    updated_product = {**create_test_product("product-1"), "name":"updated product", "version":2}
+    #ACT
+    previous_product = products_storage.put_if(updated_product, {"owner_id":"test user id", "version":1})
+    #ASSERT
+    assert previous_product["version"] == 1
+    assert products_storage.get("product-1") == updated_product
+
+
+def test_put_if_fails_for_outdated_version(products_storage):
+    #ARRANGE
+    products_storage.put({**create_test_product("product-1"), "version":2})
+    #ACT / ASSERT
+    with pytest.raises(storage.ConditionFailedError) as error:
+        products_storage.put_if({**create_test_product("product-1"), "version":2}, {"version":1})
+    assert error.value.item["version"] == 2
+    assert products_storage.get("product-1")["version"] == 2
+
+
+def test_update_if_fails_for_not_existing_product(products_storage):
+    #ACT / ASSERT
+    with pytest.raises(storage.ConditionFailedError) as error:
+        products_storage.update_if({"name":"updated product"}, "not-existing-product", {"version":1})
+    assert error.value.item is None
+
+
+def test_update_if_merges_updates_if_conditions_match(products_storage):
+    #ARRANGE
+    products_storage.put(create_test_product("product-1"))
+    #ACT
+    previous_product = products_storage.update_if({"name":"updated product", "version":1}, "product-1", {"version":None})
+    #ASSERT
+    assert previous_product == create_test_product("product-1")
+    assert products_storage.get("product-1") == {**create_test_product("product-1"), "name":"updated product", "version":1}
+
+
+def test_delete_if_only_deletes_product_of_owner(products_storage):
+    #ARRANGE
+    products_storage.put(create_test_product("product-1"))
+    #ACT
+    with pytest.raises(storage.ConditionFailedError):
+        products_storage.delete_if("product-1", {"owner_id":"different user id"})
+    deleted_product = products_storage.delete_if("product-1", {"owner_id":"test user id"})
+    #ASSERT
+    assert deleted_product == create_test_product("product-1")
+    assert products_storage.get("product-1") is None
+
+
+def test_deta_storage_checks_conditions_against_passed_item_without_reading():
+    #ARRANGE
+    deta_base = FakeDetaBase()
+    products_storage = storage.DetaStorage(None, "products", base=deta_base)
+    deta_base.put({**create_test_product("product-1"), "version":1})
+    #ACT
+    current_product = products_storage.get("product-1")
+    products_storage.put_if({**create_test_product("product-1"), "version":2}, {"version":1}, current_product)
+    #ASSERT
+    assert deta_base.calls["get"] == 1
+    assert products_storage.get("product-1")["version"] == 2
+
+
+def test_deta_storage_reads_passed_item_again_if_written_since():
+    #ARRANGE
+    deta_base = FakeDetaBase()
+    products_storage = storage.DetaStorage(None, "products", base=deta_base)
+    products_storage.put({**create_test_product("product-1"), "version":1})
+    outdated_product = products_storage.get("product-1")
+    products_storage.update_if({"version":2}, "product-1", {"version":1}, outdated_product)
+    #ACT / ASSERT
+    with pytest.raises(storage.ConditionFailedError) as error:
+        products_storage.put_if({**create_test_product("product-1"), "version":2}, {"version":1}, outdated_product)
+    assert error.value.item["version"] == 2
+    assert deta_base.calls["get"] == 2
+
+
+class BlockingDetaBase(FakeDetaBase):
+    def __init__(self, blocked_key:str):
+        super().__init__()
+        self.blocked_key = blocked_key
+        self.blocked = threading.Event()
+        self.release = threading.Event()
+
+    def get(self, key:str):
+        if key == self.blocked_key:
+            self.blocked.set()
+            self.release.wait(timeout=5)
+        return super().get(key)
+
+
+def test_deta_storage_locks_conditional_writes_per_key():
+    #ARRANGE
+    deta_base = BlockingDetaBase("product-1")
+    products_storage = storage.DetaStorage(None, "products", base=deta_base)
+    deta_base.put(create_test_product("product-1"))
+    deta_base.put(create_test_product("product-2"))
+    blocked_write = threading.Thread(target=products_storage.delete_if, args=("product-1", {"owner_id":"test user id"}))
+    blocked_write.start()
+    deta_base.blocked.wait(timeout=5)
+    #ACT
+    deleted_product = products_storage.delete_if("product-2", {"owner_id":"test user id"})
+    blocked_write_finished = not blocked_write.is_alive()
+    deta_base.release.set()
+    blocked_write.join(timeout=5)
+    #ASSERT
+    assert deleted_product["key"] == "product-2"
+    assert not blocked_write_finished
+    assert products_storage.get("product-1") is None
+
+
+def test_sqlite_storage_uses_wal_mode_and_owner_index(tmp_path):
+    #ARRANGE
+    products_storage = storage.SQLiteStorage(str(tmp_path / "products.sqlite3"), "products")
+    #ACT
+    journal_mode = products_storage._connection.execute("PRAGMA journal_mode").fetchone()[0]
+    query_plan = products_storage._connection.execute(
+        "EXPLAIN QUERY PLAN SELECT data FROM products WHERE owner_id = ? ORDER BY key", ("test user id",)
+    ).fetchall()
+    #ASSERT
+    assert journal_mode == "wal"
+    assert "products_owner_id" in str(query_plan)
+    products_storage.close()
+
+
+def test_lazy_storage_creates_storage_on_first_use(monkeypatch):
+    #ARRANGE
+    created_storages = []
+    def create_memory_storage():
+        created_storages.append(storage.MemoryStorage())
+        return created_storages[-1]
+    lazy_storage = storage.LazyStorage(create_memory_storage)
+    #ACT
+    created_before_use = list(created_storages)
+    lazy_storage.put(create_test_product("product-1"))
+    lazy_storage.get("product-1")
+    monkeypatch.setattr(storage.os, "getpid", lambda: -1)
+    product_in_child_process = lazy_storage.get("product-1")
+    #ASSERT
+    assert created_before_use == []
+    assert len(created_storages) == 2
+    assert product_in_child_process is None
@@ -0,0 +1,50 @@
+from modules.ttl_cache.ttl_cache import TTLCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_returns_stored_value_and_counts_hit():
+    #ARRANGE
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set("component-a", 100.5)
+    #ACT
+    value = cache.get("component-a")
+    #ASSERT
+    assert value == 100.5
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 0
+
+
+def test_cache_expires_values_after_ttl_but_keeps_them_for_peek():
+    #ARRANGE
+    timer = FakeTimer()
+    cache = TTLCache(max_size=2, ttl=10, timer=timer)
+    cache.set("component-a", 100.5)
+    #ACT
+    timer.now = 10.5
+    value = cache.get("component-a")
+    #ASSERT
+    assert value is None
+    assert cache.stats()["misses"] == 1
+    assert cache.peek("component-a") == 100.5
+
+
+def test_cache_evicts_least_recently_used_value():
+    #ARRANGE
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set("component-a", 1.0)
+    cache.set("component-b", 2.0)
+    cache.get("component-a")
+    #ACT
+    cache.set("component-c", 3.0)
+    #ASSERT
+    assert cache.get("component-b") is None
+    assert cache.get("component-a") == 1.0
+    assert cache.get("component-c") == 3.0
+    assert cache.stats()["evictions"] == 1
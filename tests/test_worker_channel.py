@@ -0,0 +1,39 @@
+from modules.worker_channel.worker_channel import WorkerChannel
+import asyncio
+
+
+def test_messages_are_delivered_to_all_other_workers(tmp_path):
+    #ARRANGE
+    received = {"worker-a": [], "worker-b": [], "worker-c": []}
+    async def exchange_messages():
+        channels = [WorkerChannel(str(tmp_path), received[name].append, name=name) for name in received]
+        for channel in channels:
+            channel.start()
+        channels[0].publish({"type": "product_deleted", "key": "product-1", "owner_id": "test user id"})
+        await asyncio.sleep(0.05)
+        for channel in channels:
+            channel.close()
+        return channels
+    #ACT
+    channels = asyncio.run(exchange_messages())
+    #ASSERT
+    assert received["worker-a"] == []
+    assert received["worker-b"] == [{"type": "product_deleted", "key": "product-1", "owner_id": "test user id"}]
+    assert received["worker-c"] == received["worker-b"]
+    assert channels[0].stats()["sent"] == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_messages_to_exited_workers_are_dropped(tmp_path):
+    #ARRANGE
+    (tmp_path / "exited.sock").touch()
+    async def publish_message():
+        channel = WorkerChannel(str(tmp_path), lambda message: None, name="worker-a")
+        channel.start()
+        channel.publish({"type": "component_price", "component_id": "component-a", "price": 1.5})
+        channel.close()
+        return channel
+    #ACT
+    channel = asyncio.run(publish_message())
+    #ASSERT
+    assert channel.stats() == {"sent": 0, "received": 0, "dropped": 1, "failed": 0}